@@ -1,3 +0,0 @@
-import gi
-
-gi.require_version('Gtk', '3.0')
@@ -1,46 +1,182 @@
 import os
 import grp
+import pwd
+import sys
 import shlex
 import logging
+import collections
 import subprocess
-
-from .utils import get_debconf, assign_variables, find_data, find_hooks
+import concurrent.futures
+
+from .hooks import run_hooks
+from .utils import get_debconf, assign_variables, chown_tree, find_data, \
+    fsync, replace_file, replace_symlink
+from .profiling import Spans, timed
+from .scheduler import Step, run_steps
+
+ZONEINFO_DIR = '/usr/share/zoneinfo'
+
+# Files that are modified by the commands we run rather than by ourselves
+MODIFIED_FILES = (
+    '/etc/passwd',
+    '/etc/shadow',
+    '/etc/group',
+    '/etc/gshadow',
+    '/etc/subuid',
+    '/etc/subgid',
+    '/etc/default/locale',
+    '/etc/localtime',
+    '/etc/timezone',
+    '/var/cache/debconf/config.dat',
+)
+
+# Machine-readable timings of each step
+SUMMARY_FILENAME = '/var/log/firstboot/apply.json'
+
+Symlink = collections.namedtuple('Symlink', ('target',))
 
 logger = logging.getLogger(__name__)
 
 
 class ApplyData(object):
-    def __init__(self, no_act):
+    def __init__(self, no_act, root='/'):
         super().__init__()
 
         self.tzmap = {}
+        self.root = root
         self.no_act = no_act
         self.groups = {'sudo'}
         self.backups = {}
         self.home_existed = True
         self.debconf_backups = {}
+        self.progress_callback = None
+        self.spans = Spans()
+
+        # Paths we have written or created, so we can fix their ownership
+        self.written = set()
+
+        # Walking the entire home directory can be very slow, so only do so
+        # if explicitly requested.
+        self.recursive_chown = \
+            os.environ.get('FIRSTBOOT_RECURSIVE_CHOWN') == '1'
+
+        # Set the timezone via tzdata's maintainer scripts instead of updating
+        # /etc/localtime and /etc/timezone ourselves.
+        self.dpkg_reconfigure_tzdata = \
+            os.environ.get('FIRSTBOOT_DPKG_RECONFIGURE_TZDATA') == '1'
 
-        # Create our Debconf instances outside of a the GTK UI thread.
+        # Query debconf in the background as it is slow to start and its
+        # database may be locked; we only need the result when applying.
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.default_groups = executor.submit(self.get_default_groups)
+        executor.shutdown(wait=False)
+
+    def get_default_groups(self):
         logger.info("Getting default user groups from debconf")
-        with get_debconf() as db:
-            self.groups.update(db.get('passwd/user-default-groups').split(' '))
 
-    def apply(self, data):
+        with timed('debconf init'), get_debconf() as db:
+            return set(db.get('passwd/user-default-groups').split())
+
+    def apply(self, data, progress_callback=None):
         logger.info("Going to apply data: %r", data)
 
+        self.progress_callback = progress_callback
+
+        # Wait for our debconf query to finish before we run anything that
+        # may also need the debconf database (eg. dpkg-reconfigure). As we
+        # have not changed anything yet, there is nothing to clean up if it
+        # failed.
+        try:
+            groups = self.default_groups.result()
+        except Exception:
+            # The database may have been locked whilst we were starting up;
+            # query it again rather than failing every attempt to apply.
+            logger.exception("Could not get default user groups; retrying")
+            groups = self.get_default_groups()
+
+        self.groups.update(groups)
+
         try:
-            self._apply(data)
+            with self.spans.span('apply'):
+                self._apply(data)
         except Exception:
             logger.exception("Exception caught whilst applying settings:")
-            self.cleanup(data)
+            self.progress("Reverting changes")
+
+            try:
+                with self.spans.span('cleanup'):
+                    self.cleanup(data)
+            finally:
+                self.write_summary()
+
             raise
 
-        self.execute(('/bin/run-parts', find_hooks('post-apply.d')))
+        self.progress("Finishing")
+
+        # Write the summary before each group of hooks in case one of them
+        # reboots the system.
+        try:
+            run_hooks(
+                'post-apply.d',
+                no_act=self.no_act,
+                spans=self.spans,
+                before_group=self.write_summary,
+            )
+        finally:
+            self.write_summary()
+
+    def path(self, filename):
+        """
+        Returns where ``filename`` is found beneath our root directory.
+        """
+
+        return os.path.join(self.root, os.path.relpath(filename, '/'))
+
+    def write_summary(self):
+        # Do not overwrite the summary of a real run in development mode
+        if self.no_act and self.root == '/':
+            logger.info("Not writing summary to %s", SUMMARY_FILENAME)
+            return
+
+        self.spans.write(self.path(SUMMARY_FILENAME))
+
+    def progress(self, msg):
+        logger.info("Progress: %s", msg)
+
+        if self.progress_callback is not None:
+            self.progress_callback(msg)
 
     def _apply(self, data):
-        self.home_existed = os.path.exists('/home/{username}'.format(**data))
+        self.home_existed = os.path.exists(
+            self.path('/home/{username}'.format(**data)),
+        )
+
+        def step(name, fn, requires=()):
+            def wrapper():
+                with self.spans.span(name):
+                    fn(data)
+
+            return Step(name, wrapper, requires)
+
+        # Steps that do not depend on each other are run concurrently.
+        run_steps((
+            step('user', self.apply_user),
+            step('groups', self.apply_groups, ('user',)),
+            step('autostart', self.apply_autostart, ('user',)),
+            step('permissions', self.apply_permissions, ('autostart',)),
+            step('hostname', self.apply_hostname),
+            step('keyboard', self.apply_keyboard),
+            step('locale', self.apply_locale),
+            step('debconf', self.apply_debconf),
+            step('timezone', self.apply_timezone, ('debconf',)),
+        ))
+
+        with self.spans.span('sync'):
+            self.sync(data)
+
+    def apply_user(self, data):
+        self.progress("Creating user account")
 
-        # User
         self.execute((
             'adduser',
             '--disabled-password',
@@ -48,41 +184,103 @@ class ApplyData(object):
             data['username'],
         ))
 
-        self.execute(
-            ('chpasswd',),
-            stdin='{username}:{password}'.format(**data).encode('utf-8'),
-        )
+        if data.get('password_hash'):
+            # eg. from a preseed file
+            self.execute(
+                ('chpasswd', '--encrypted'),
+                stdin='{username}:{password_hash}'.format(**data)
+                .encode('utf-8'),
+            )
+        else:
+            self.execute(
+                ('chpasswd',),
+                stdin='{username}:{password}'.format(**data).encode('utf-8'),
+            )
 
+    def apply_groups(self, data):
         all_groups = {x.gr_name for x in grp.getgrall()}
-        for x in self.groups:
-            if x not in all_groups:
-                continue
+        groups = sorted(x for x in self.groups if x in all_groups)
+
+        if not groups:
+            return
+
+        # Add the user to all groups at once rather than calling adduser (and
+        # rewriting /etc/group) once per group.
+        self.execute((
+            'usermod',
+            '--append',
+            '--groups', ','.join(groups),
+            data['username'],
+        ))
+
+        if self.no_act:
+            return
 
-            self.execute(('adduser', data['username'], x))
+        missing = [
+            x for x in groups
+            if data['username'] not in grp.getgrnam(x).gr_mem
+        ]
 
-        cmd = '/bin/run-parts {}'.format(find_hooks('first-login.d'))
+        if missing:
+            raise RuntimeError("{} was not added to group(s): {}".format(
+                data['username'],
+                ', '.join(missing),
+            ))
+
+    def apply_autostart(self, data):
+        cmd = '{} -m firstboot.hooks first-login.d'.format(
+            shlex.quote(sys.executable),
+        )
 
         with open(find_data('firstboot.desktop')) as f:
             self.overwrite_file(
-                '/home/{username}/.config/autostart/firstboot.desktop'
-                .format(**data),
+                self.path(
+                    '/home/{username}/.config/autostart/firstboot.desktop'
+                    .format(**data),
+                ),
                 f.read().replace('@CMD@', cmd),
                 allow_missing=True,
             )
 
-        # Set permissions
-        self.execute((
-            'chown',
-            '-R',
-            '{username}:{username}'.format(**data),
-            '/home/{username}'.format(**data),
-        ))
+    def apply_permissions(self, data):
+        home = self.path('/home/{username}'.format(**data))
+
+        if self.no_act:
+            logger.info("Not changing ownership of files in %s", home)
+            return
+
+        user = pwd.getpwnam(data['username'])
 
-        # Hosts
-        with open('/etc/hosts') as f:
+        if self.recursive_chown:
+            self.progress("Setting file permissions")
+            logger.info("Changing ownership of %s recursively", home)
+            changed = chown_tree(home, user.pw_uid, user.pw_gid)
+            logger.info("Changed ownership of %d path(s)", changed)
+            return
+
+        # adduser only creates the home directory (with the correct
+        # ownership) if it did not already exist. An existing one may belong
+        # to a previous user with a different UID, so fix it but leave its
+        # contents alone unless asked to.
+        if self.home_existed:
+            logger.info("Changing ownership of %s", home)
+            os.chown(home, user.pw_uid, user.pw_gid)
+
+        # Fix the files we have created inside it.
+        for x in sorted(self.written):
+            if not x.startswith(home + os.sep):
+                continue
+
+            logger.info("Changing ownership of %s", x)
+            os.chown(x, user.pw_uid, user.pw_gid, follow_symlinks=False)
+
+    def apply_hostname(self, data):
+        self.progress("Setting hostname")
+
+        with open(self.path('/etc/hosts')) as f:
             etc_hosts = f.read()
 
-        with open('/etc/hostname') as f:
+        with open(self.path('/etc/hostname')) as f:
             hostname, _, domain = f.read().strip().partition('.')
 
         # If we had an existing hostname like "example.domain", we need to
@@ -96,25 +294,33 @@ class ApplyData(object):
         # ... then replace all other instances.
         etc_hosts = etc_hosts.replace(hostname, data['hostname'])
 
-        self.overwrite_file('/etc/hosts', etc_hosts)
-        self.overwrite_file('/etc/hostname', '{}\n'.format(data['hostname']))
+        self.overwrite_file(self.path('/etc/hosts'), etc_hosts)
+        self.overwrite_file(
+            self.path('/etc/hostname'),
+            '{}\n'.format(data['hostname']),
+        )
 
-        # Keyboard
-        with open('/etc/default/keyboard') as f:
+    def apply_keyboard(self, data):
+        self.progress("Configuring keyboard")
+
+        with open(self.path('/etc/default/keyboard')) as f:
             keyboard = f.read()
 
         self.overwrite_file(
-            '/etc/default/keyboard',
+            self.path('/etc/default/keyboard'),
             assign_variables(keyboard, {
                 'XKBLAYOUT': data['keyboard_layout'],
                 'XKBVARIANT': data['keyboard_variant'],
             }),
         )
 
+    def apply_locale(self, data):
+        self.progress("Configuring language")
+
         # Take a backup of this file by doing no processing
-        with open('/etc/default/locale') as f:
+        with open(self.path('/etc/default/locale')) as f:
             locale = f.read()
-        self.overwrite_file('/etc/default/locale', locale)
+        self.overwrite_file(self.path('/etc/default/locale'), locale)
 
         # FIXME: "mono countries"; also why assume utf-8?
         # eg. LANG="en_GB.UTF-8"
@@ -133,28 +339,92 @@ class ApplyData(object):
             'LANGUAGE={}'.format(shlex.quote(language)),
         ))
 
-        # Set timezone
-
+    def apply_debconf(self, data):
         area, _, zone = data['timezone'].partition('/')
 
-        self.execute(
-            'echo tzdata tzdata/Areas select {0} | debconf-set-selections'
-            .format(area, zone), shell=True)
-        self.execute(
-            'echo tzdata tzdata/Zones/{0} select {1} | debconf-set-selections'
-            .format(area, zone), shell=True)
-        self.execute(('dpkg-reconfigure', '-pcritical', 'tzdata'))
+        # Set all our selections over a single debconf connection
+        self.db_set(collections.OrderedDict((
+            ('tzdata/Areas', area),
+            ('tzdata/Zones/{}'.format(area), zone),
+        )))
+
+    def apply_timezone(self, data):
+        self.progress("Setting time zone")
+
+        # We can only back up (and thus restore) /etc/localtime if it is a
+        # symlink, as it is on any system installed since jessie.
+        if self.dpkg_reconfigure_tzdata or \
+                not os.path.islink(self.path('/etc/localtime')):
+            self.execute(('dpkg-reconfigure', '-pcritical', 'tzdata'))
+            return
+
+        # Do what tzdata.postinst does; debconf has already been updated so
+        # that a later dpkg-reconfigure agrees with us.
+        zoneinfo = os.path.join(ZONEINFO_DIR, data['timezone'])
+
+        if not os.path.isfile(self.path(zoneinfo)):
+            raise FileNotFoundError("Could not find {}".format(zoneinfo))
+
+        self.overwrite_symlink(self.path('/etc/localtime'), zoneinfo)
+        self.overwrite_file(
+            self.path('/etc/timezone'),
+            '{}\n'.format(data['timezone']),
+            allow_missing=True,
+        )
 
     def cleanup(self, data):
         logger.warning("Cleaning up %r", data)
 
-        self.execute(('deluser', data['username']))
-        self.db_set(self.debconf_backups)
+        def user():
+            self.execute(('deluser', data['username']))
+
+        def debconf():
+            self.db_set(self.debconf_backups)
+
+        def home():
+            if self.home_existed:
+                return
+
+            self.execute((
+                'rm',
+                '-rf',
+                self.path('/home/{username}'.format(**data)),
+            ))
+
+        def files():
+            self.restore_backups()
+            self.sync(data)
+
+        # Steps run concurrently, so whichever failed, any of the others may
+        # have made changes. Attempt every stage regardless so that we always
+        # restore the files we overwrote.
+        for name, fn in (
+            ('user', user),
+            ('debconf', debconf),
+            ('home', home),
+            ('files', files),
+        ):
+            try:
+                with self.spans.span('cleanup {}'.format(name)):
+                    fn()
+            except Exception:
+                logger.exception(
+                    "Exception caught whilst cleaning up %s:", name,
+                )
+
+    def restore_backups(self):
+        for filename, contents in self.backups.items():
+            if isinstance(contents, Symlink):
+                logger.info(
+                    'Restoring %s as a symlink to %s',
+                    filename, contents.target,
+                )
 
-        if not self.home_existed:
-            self.execute(('rm', '-rf', '/home/{username}'.format(**data)))
+                if not self.no_act:
+                    replace_symlink(contents.target, filename)
+
+                continue
 
-        for filename, contents in self.backups.items():
             logger.info('Restoring %s with:', filename)
             for x in contents.splitlines():
                 logger.info(x)
@@ -162,8 +432,37 @@ class ApplyData(object):
             if self.no_act:
                 continue
 
-            with open(filename, 'w') as f:
-                f.write(contents)
+            replace_file(filename, contents)
+
+    def sync(self, data):
+        """
+        Flushes the files that we (or the commands we ran) have modified, and
+        the directories containing them, rather than every filesystem.
+        """
+
+        paths = set(self.written)
+        paths.update(self.backups)
+        paths.update(self.path(x) for x in MODIFIED_FILES)
+
+        # adduser populates the home directory from /etc/skel
+        home = self.path('/home/{username}'.format(**data))
+        if not self.home_existed:
+            for dirpath, dirnames, filenames in os.walk(home):
+                paths.add(dirpath)
+                paths.update(os.path.join(dirpath, x) for x in filenames)
+
+        # Flush the targets of symlinks as well as their directories
+        paths.update([os.path.realpath(x) for x in paths])
+        paths.update([os.path.dirname(x) for x in paths])
+
+        if self.no_act:
+            logger.info("Not flushing %d path(s) to disk", len(paths))
+            return
+
+        logger.info("Flushing %d path(s) to disk", len(paths))
+
+        for x in sorted(paths):
+            fsync(x)
 
     def execute(self, cmd, stdin=None, *args, **kwargs):
         cmd_fmt = '"{}"'.format(cmd) \
@@ -178,11 +477,19 @@ class ApplyData(object):
         if self.no_act:
             return
 
+        kwargs.setdefault('stdout', subprocess.PIPE)
+        kwargs.setdefault('stderr', subprocess.STDOUT)
+
         with subprocess.Popen(cmd, **kwargs) as p:
-            if stdin is not None:
-                p.communicate(input=stdin)
+            output, _ = p.communicate(input=stdin)
             retcode = p.wait()
 
+        output = output or b''
+        for x in output.decode('utf-8', 'replace').splitlines():
+            logger.info("  %s", x)
+
+        self.spans.record_command(retcode, len(output))
+
         if retcode:
             raise subprocess.CalledProcessError(retcode, cmd_fmt)
 
@@ -197,20 +504,48 @@ class ApplyData(object):
             with open(filename, 'r') as f:
                 self.backups[filename] = f.read()
 
+        self.written.add(filename)
+
+        dirname = os.path.dirname(filename)
+        while not os.path.exists(dirname):
+            self.written.add(dirname)
+            dirname = os.path.dirname(dirname)
+
         if self.no_act:
             return
 
         os.makedirs(os.path.dirname(filename), exist_ok=True)
 
-        with open(filename, 'w') as f:
-            f.write(contents)
+        # Write to a temporary file and rename it over the original so that
+        # we never leave a truncated file behind. It is flushed in ``sync``.
+        replace_file(filename, contents)
+
+    def overwrite_symlink(self, filename, target):
+        logger.info("Pointing %s at %s", filename, target)
+
+        self.backups[filename] = Symlink(os.readlink(filename))
+
+        if self.no_act:
+            return
+
+        replace_symlink(target, filename)
 
     def db_set(self, data):
+        if not data:
+            return
+
         with get_debconf() as db:
-            self.debconf_backups[k] = db.get(k)
-            # self.debconf_backups[k] = db.get(k)
-            logger.info(
-                "Setting debconf value %r -> %r (was: %r",
-                k, v, self.debconf_backups[k],
-            )
-            db.set(k, v)
+            for k, v in list(data.items()):
+                # Only keep the first (ie. original) value for cleanup
+                self.debconf_backups.setdefault(k, db.get(k))
+
+                logger.info(
+                    "Setting debconf value %r -> %r (was: %r)",
+                    k, v, self.debconf_backups[k],
+                )
+
+                if self.no_act:
+                    continue
+
+                db.set(k, v)
+                db.fset(k, 'seen', 'true')
@@ -1,11 +1,21 @@
 #!/usr/bin/env python3
 
+import gi
 import logging
+import threading
+import collections.abc
 
-from gi.repository import Gtk, GdkPixbuf
+gi.require_version('Gtk', '3.0')
 
-from .utils import find_data, import_from_string
-from .apply_data import ApplyData
+from gi.repository import Gtk, GLib  # noqa: E402
+
+from . import data, header  # noqa: E402
+from .utils import import_from_string  # noqa: E402
+from .state import State  # noqa: E402
+from .loader import Loader  # noqa: E402
+from .profiling import mark, timed  # noqa: E402
+from .hooks import HookError  # noqa: E402
+from .apply_data import ApplyData  # noqa: E402
 
 PAGES = (
     'firstboot.pages.welcome.Welcome',
@@ -28,23 +38,33 @@ class Assistant(Gtk.Window):
         Gtk.Window.__init__(self)
 
         self.complete = False
+        self.load_failed = False
         self.development = development
 
+        # Unlike Gtk.Notebook.get_current_page, this is updated before any
+        # handlers of the switch-page signal are called.
+        self.current_page = PAGES[0]
+
         self.apply_data = ApplyData(no_act=self.development)
 
+        # Start parsing page data whilst the window is being created
+        self.loader = Loader()
+        for x in data.PARSERS:
+            self.loader.submit(x, data.get, x)
+
         self.connect('delete-event', self.on_delete_event)
         self.set_default_size(800, 650)
         self.set_position(Gtk.WindowPosition.CENTER)
 
-        # Add image
-        pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_scale(
-            find_data('header.svg'),
-            self.get_size()[0],
-            -1,
-            True,
-        )
+        # Add image, rendering it in the background if it is not cached
         image = Gtk.Image()
-        image.set_from_pixbuf(pixbuf)
+        width = self.get_size()[0]
+        pixbuf = header.load(width)
+        if pixbuf is None:
+            self.loader.submit('header', header.render, width)
+            self.loader.when_ready('header', image.set_from_pixbuf)
+        else:
+            image.set_from_pixbuf(pixbuf)
 
         self.notebook = Gtk.Notebook(show_tabs=False)
 
@@ -61,7 +81,10 @@ class Assistant(Gtk.Window):
 
         self.btn_apply.connect('clicked', self.on_btn_apply_clicked)
 
+        self.status = Gtk.Label()
+
         action_box = Gtk.HBox(spacing=6, border_width=6)
+        action_box.pack_start(self.status, False, False, 0)
         action_box.pack_end(self.btn_apply, False, False, 0)
         for x in (self.btn_next, self.btn_prev):
             action_box.pack_end(x, False, False, 0)
@@ -73,43 +96,103 @@ class Assistant(Gtk.Window):
         vbox.pack_start(action_box, False, False, 0)
         self.add(vbox)
 
-        self.pages = {}
+        # Pages are constructed on demand; we only add a placeholder for
+        # each one so that the notebook knows how many there are.
+        self.state = State()
+        self.pages = Pages(self)
         for x in PAGES:
-            page = import_from_string(x)(x, self)
-            page.set_border_width(20)
+            self.notebook.append_page(Gtk.Box())
 
-            self.pages[x] = page
-            self.notebook.append_page(page)
+        self.pages[PAGES[0]]
 
         # Bind late
         self.notebook.connect('switch-page', self.on_switch_page)
+        self.first_draw_handler = self.connect('draw', self.on_first_draw)
+
+    def build_page(self, name):
+        logger.debug("Constructing page %s", name)
+
+        with timed('import {}'.format(name)):
+            cls = import_from_string(name)
+
+        with timed('construct {}'.format(name)):
+            page = cls(name, self)
+
+        page.set_border_width(20)
+
+        placeholder = self.notebook.get_nth_page(PAGES.index(name))
+        placeholder.pack_start(page, True, True, 0)
+        page.show_all()
+
+        return page
+
+    def on_first_draw(self, *args):
+        self.disconnect(self.first_draw_handler)
+
+        mark('first-draw')
+
+        # Construct the remaining pages once the first frame is visible
+        GLib.idle_add(self.on_idle_build_page)
+
+        return False
+
+    def on_idle_build_page(self):
+        for x in PAGES:
+            if x not in self.pages.built:
+                self.pages[x]
+                return True
+
+        return False
 
     def set_page_complete(self, page, complete):
         page.complete = complete
-        self.btn_next.set_sensitive(complete)
 
-    def on_switch_page(self, notebook, page, page_num):
+        # Pages may be validated in the background
+        if page.name != self.current_page:
+            return
+
+        self.btn_next.set_sensitive(complete and page.ready)
+
+    def on_page_ready(self, page):
+        if page.name != self.current_page:
+            return
+
+        self.btn_next.set_sensitive(page.complete)
+        page.on_switch()
+
+    def on_page_load_failed(self, page, exc):
+        # The page cannot be completed, so allow ourselves to quit rather than
+        # leaving the user stuck.
+        self.load_failed = True
+
+        self.status.set_text("Could not load all pages; please restart.")
+
+    def on_switch_page(self, notebook, placeholder, page_num):
+        # Render any validation errors still pending from the previous page
+        for x in self.pages.built.values():
+            x.flush_validation()
+
+        self.current_page = PAGES[page_num]
+        page = self.pages[self.current_page]
+
         logger.info("Switching page to %s", page.name)
         logger.debug("get_all_apply_data() -> %s", self.get_all_apply_data())
 
         last_page = page_num + 1 == self.notebook.get_n_pages()
 
         self.btn_next.set_visible(not last_page)
-        self.btn_next.set_sensitive(page.complete)
+        self.btn_next.set_sensitive(page.complete and page.ready)
         self.btn_prev.set_visible(page_num > 0)
         self.btn_apply.set_visible(last_page)
 
         self.unset_focus_chain()
 
-        page.on_switch()
+        # Otherwise, this is called via on_page_ready
+        if page.ready:
+            page.on_switch()
 
     def get_all_apply_data(self):
-        data = {}
-
-        for x in self.pages.values():
-            data.update(x.get_apply_data())
-
-        return data
+        return self.state.get()
 
     def on_btn_prev_next_clicked(self, btn, *args):
         idx = self.notebook.get_current_page()
@@ -121,13 +204,109 @@ class Assistant(Gtk.Window):
         self.btn_apply.set_sensitive(False)
         self.btn_apply.set_label("Please wait...")
 
+        # Keep the main loop running whilst we apply the settings
+        thread = threading.Thread(
+            target=self.apply_in_background,
+            args=(self.get_all_apply_data(),),
+            daemon=True,
+        )
+        thread.start()
+
+    def apply_in_background(self, data):
+        def progress_callback(msg):
+            GLib.idle_add(self.on_apply_progress, msg)
+
+        try:
+            self.apply_data.apply(data, progress_callback)
+        except HookError as exc:
+            GLib.idle_add(self.on_apply_hooks_failed, exc)
+        except Exception as exc:
+            GLib.idle_add(self.on_apply_failed, exc)
+        else:
+            GLib.idle_add(self.on_apply_finished)
+
+    def on_apply_progress(self, msg):
+        self.status.set_text("{}...".format(msg))
+
+        return False
+
+    def on_apply_finished(self):
         # Allow ourselves to quit
         self.complete = True
 
-        self.apply_data.apply(self.get_all_apply_data())
+        self.status.set_text("Done.")
+
+        return False
+
+    def on_apply_hooks_failed(self, exc):
+        # Our settings were applied and have not been reverted, so do not
+        # allow them to be applied again but allow ourselves to quit.
+        self.complete = True
+
+        self.status.set_text("Done, but some hooks failed.")
+
+        self.show_error(
+            "Your settings were applied but could not be finished.",
+            exc,
+        )
+
+        return False
+
+    def on_apply_failed(self, exc):
+        self.status.set_text('')
+
+        self.show_error("Your settings could not be applied.", exc)
+
+        self.btn_prev.set_sensitive(True)
+        self.btn_apply.set_sensitive(True)
+        self.btn_apply.set_label("_Apply")
+
+        return False
+
+    def show_error(self, text, exc):
+        dialog = Gtk.MessageDialog(
+            transient_for=self,
+            message_type=Gtk.MessageType.ERROR,
+            buttons=Gtk.ButtonsType.CLOSE,
+            text=text,
+            secondary_text=str(exc),
+        )
+        dialog.run()
+        dialog.destroy()
 
     def on_delete_event(self, *args):
-        if not self.development and not self.complete:
+        if not self.development and not self.complete and \
+                not self.load_failed:
             return True
 
         Gtk.main_quit()
+
+
+class Pages(collections.abc.Mapping):
+    """
+    Mapping of page names to pages, constructing each page the first time it
+    is looked up.
+    """
+
+    def __init__(self, assistant):
+        self.assistant = assistant
+        self.built = collections.OrderedDict()
+
+    def __getitem__(self, name):
+        try:
+            return self.built[name]
+        except KeyError:
+            if name not in PAGES:
+                raise
+
+        page = self.assistant.build_page(name)
+        self.built[name] = page
+        self.assistant.state.add(page)
+
+        return page
+
+    def __iter__(self):
+        return iter(PAGES)
+
+    def __len__(self):
+        return len(PAGES)
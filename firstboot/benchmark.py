@@ -0,0 +1,279 @@
+"""
+Benchmarks for firstboot, writing the results as JSON so that they can be
+compared between releases. Does not require root but the page benchmarks
+require a display, eg.:
+
+  $ xvfb-run -a python3 -m firstboot.benchmark --output benchmark.json
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import itertools
+import contextlib
+import collections
+import unittest.mock
+
+from . import data
+from .utils import assign_variables, import_from_string
+
+REPEAT = 10
+
+# Pairs of (language, country) to cycle through when switching pages
+LOCALES = (
+    ('en', 'US'),
+    ('de', 'DE'),
+    ('fr', 'FR'),
+    ('pt_BR', 'BR'),
+    ('ja', 'JP'),
+)
+
+APPLY_DATA = {
+    'full_name': "Benchmark User",
+    'username': 'benchmark',
+    'password': 'password',
+    'password_confirm': 'password',
+    'hostname': 'benchmark-pc',
+    'language': 'en',
+    'country': 'GB',
+    'timezone': 'Europe/London',
+    'keyboard_layout': 'gb',
+    'keyboard_variant': '',
+}
+
+FAKE_ROOT = {
+    'etc/hosts': '127.0.0.1\tlocalhost\n127.0.1.1\tdebian\n',
+    'etc/hostname': 'debian\n',
+    'etc/timezone': 'Etc/UTC\n',
+    'etc/default/locale': 'LANG=C.UTF-8\n',
+    'etc/default/keyboard': 'XKBMODEL="pc105"\nXKBLAYOUT="us"\n'
+                            'XKBVARIANT=""\nXKBOPTIONS=""\n',
+    'usr/share/zoneinfo/Etc/UTC': '',
+    'usr/share/zoneinfo/Europe/London': '',
+}
+
+logger = logging.getLogger(__name__)
+
+
+class FakeDebconf(object):
+    """
+    Answers every question with an empty value so that we do not need root.
+    """
+
+    def get(self, key):
+        return ''
+
+    def set(self, key, value):
+        pass
+
+    def fset(self, key, flag, value):
+        pass
+
+
+@contextlib.contextmanager
+def fake_debconf():
+    yield FakeDebconf()
+
+
+def measure(fn, repeat, setup=None):
+    """
+    Calls ``fn`` ``repeat`` times, returning a summary of how long it took in
+    milliseconds. ``setup`` is called before each call but is not timed.
+    """
+
+    timings = []
+
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    timings.sort()
+
+    return collections.OrderedDict((
+        ('repeat', repeat),
+        ('min_ms', round(timings[0], 3)),
+        ('median_ms', round(timings[len(timings) // 2], 3)),
+        ('max_ms', round(timings[-1], 3)),
+    ))
+
+
+def benchmark_data(repeat):
+    sources = data.sources()
+
+    return collections.OrderedDict(
+        (k, measure(lambda: fn(sources), repeat))
+        for k, fn in data.PARSERS.items()
+    )
+
+
+def benchmark_assign_variables(repeat):
+    config = ''.join(
+        '# Comment {0}\nVARIABLE_{0}="value {0}"\n'.format(x)
+        for x in range(5000)
+    )
+
+    pairs = collections.OrderedDict((
+        ('VARIABLE_0', 'first'),
+        ('VARIABLE_2500', 'middle'),
+        ('VARIABLE_4999', "it's last"),
+    ))
+
+    return measure(lambda: assign_variables(config, pairs), repeat)
+
+
+def benchmark_apply(repeat, root):
+    from .apply_data import ApplyData
+
+    for k, v in FAKE_ROOT.items():
+        filename = os.path.join(root, k)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+
+        with open(filename, 'w') as f:
+            f.write(v)
+
+    os.makedirs(os.path.join(root, 'home'), exist_ok=True)
+    os.symlink(
+        '/usr/share/zoneinfo/Etc/UTC',
+        os.path.join(root, 'etc/localtime'),
+    )
+
+    def fn():
+        ApplyData(no_act=True, root=root).apply(dict(APPLY_DATA))
+
+    return measure(fn, repeat)
+
+
+def benchmark_pages(repeat):
+    from .assistant import PAGES, Assistant
+    from gi.repository import Gtk
+
+    if not Gtk.init_check(sys.argv)[0]:
+        raise RuntimeError(
+            "Could not open display; run under xvfb-run or pass --no-gui",
+        )
+
+    result = collections.OrderedDict()
+
+    # Modules are only imported once so we can only time this once
+    for x in PAGES:
+        result[x] = collections.OrderedDict()
+        result[x]['import'] = measure(lambda: import_from_string(x), 1)
+
+    assistant = Assistant(development=True)
+
+    for x in PAGES:
+        cls = import_from_string(x)
+        result[x]['construct'] = measure(lambda: cls(x, assistant), repeat)
+
+        if cls.dataset is None:
+            continue
+
+        # Pages fill their models once their data has loaded, so time this
+        # separately on a fresh page each time.
+        dataset = data.get(cls.dataset)
+        fresh = []
+        result[x]['populate'] = measure(
+            lambda: fresh[-1].populate(dataset),
+            repeat,
+            lambda: fresh.append(cls(x, assistant)),
+        )
+
+    pages = [assistant.pages[x] for x in PAGES]
+
+    # Wait for the pages to be populated in the background
+    while not all(x.ready for x in pages):
+        Gtk.main_iteration()
+
+    return result, benchmark_on_switch(repeat, assistant)
+
+
+def benchmark_on_switch(repeat, assistant):
+    language = assistant.pages['firstboot.pages.language.Language']
+    country = assistant.pages['firstboot.pages.country.Country']
+    timezone = assistant.pages['firstboot.pages.timezone.Timezone']
+    keyboard = assistant.pages['firstboot.pages.keyboard.Keyboard']
+
+    locales = itertools.cycle(LOCALES)
+    selected = {}
+
+    # Mimic selecting a different language (and country) each time so that
+    # we measure updating the shortlists, not just redisplaying them.
+    def select_language():
+        language.selected, selected['country'] = next(locales)
+        language.changed()
+
+        country.selected = None
+        country.changed()
+
+    def select_country():
+        select_language()
+        country.selected = selected['country']
+        country.changed()
+
+        for x in (timezone, keyboard):
+            x.selected = None
+            x.changed()
+
+    return collections.OrderedDict((
+        ('country', measure(country.on_switch, repeat, select_language)),
+        ('timezone', measure(timezone.on_switch, repeat, select_country)),
+        ('keyboard', measure(keyboard.on_switch, repeat, select_country)),
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--output',
+        metavar='FILE',
+        help="write results to FILE instead of stdout",
+    )
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=REPEAT,
+        help="number of times to run each benchmark (default: %(default)s)",
+    )
+    parser.add_argument(
+        '--no-gui',
+        action='store_true',
+        help="skip benchmarks that require a display",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    results = collections.OrderedDict()
+    results['python'] = sys.version.split()[0]
+    results['data'] = benchmark_data(args.repeat)
+    results['assign_variables'] = benchmark_assign_variables(args.repeat)
+
+    # ApplyData queries debconf in the background, so keep this in place
+    # for the duration.
+    with unittest.mock.patch('firstboot.apply_data.get_debconf', fake_debconf):
+        with tempfile.TemporaryDirectory() as root:
+            results['apply'] = benchmark_apply(args.repeat, root)
+
+        if not args.no_gui:
+            results['pages'], results['on_switch'] = \
+                benchmark_pages(args.repeat)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        logger.info("Wrote results to %s", args.output)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,330 @@
+import os
+import re
+import json
+import pickle
+import logging
+import collections
+
+from .utils import CACHE_DIR, atomic_write, find_data, load_data
+from .profiling import timed
+
+CACHE_VERSION = 2
+CACHE_FILENAME = os.path.join(CACHE_DIR, 'data.pickle')
+
+re_supported = re.compile(
+    r'^(?P<language_code>[^_]+)_(?P<country_code>[^@. ]+)'
+)
+
+logger = logging.getLogger(__name__)
+
+_cache = None
+
+
+def sources():
+    return {
+        'kbdnames': find_data('kbdnames'),
+        'keyboard-configuration': find_data('keyboard-configuration'),
+        'languagelist': find_data('languagelist'),
+        'regionmap': find_data('regionmap'),
+        'iso_3166-1': '/usr/share/iso-codes/json/iso_3166-1.json',
+        'SUPPORTED': '/usr/share/i18n/SUPPORTED',
+        'zone.tab': '/usr/share/zoneinfo/zone.tab',
+        'tzmap.override': find_data('tzmap.override'),
+    }
+
+
+def parse_keyboard(sources):
+    layouts = collections.OrderedDict()
+    locales = collections.OrderedDict()
+
+    for x in load_data(sources['kbdnames']):
+        lang, type_, layout_code, data = x.split('*', 3)
+
+        if lang != 'C':
+            continue
+
+        if type_ == 'layout':
+            layouts[layout_code] = {
+                'code': layout_code,
+                'title': data,
+                'variants': collections.OrderedDict(),
+            }
+        elif type_ == 'variant':
+            variant_code, title = data.split('*', 1)
+
+            if not variant_code:
+                continue
+
+            parent = layouts[layout_code]
+            title = title.replace("{title} - ".format(**parent), '')
+
+            parent['variants'][variant_code] = {
+                'code': variant_code,
+                'title': title,
+            }
+
+    for x in load_data(sources['keyboard-configuration']):
+        wildcard, _, data = x.partition('\t')
+        layout_codes, _, variant_code = data.partition('\t')
+        layout_code, _, _ = layout_codes.partition(',')
+        variant_code = variant_code.replace(',', '')
+
+        try:
+            layout = layouts[layout_code]
+        except KeyError:
+            continue
+
+        if variant_code and variant_code not in layout['variants']:
+            continue
+
+        locales[wildcard] = (layout_code, variant_code)
+
+    return {
+        'layouts': layouts,
+        'locales': locales,
+    }
+
+
+def parse_languages(sources):
+    languages = collections.OrderedDict()
+
+    for line in load_data(sources['languagelist']):
+        parsed = dict(zip((
+            'langcode',
+            'language_en',
+            'language_orig',
+            'supported_environments',
+            'countrycode',
+            'fallbacklocale',
+            'langlist',
+            'console-setup',
+        ), line.split(';')))
+
+        languages[parsed['langcode']] = parsed
+
+    return languages
+
+
+def parse_countries(sources):
+    regions = collections.OrderedDict()
+    countries = collections.OrderedDict()
+    shortlist = {}
+
+    with open(sources['iso_3166-1']) as f:
+        title_lookup = {
+            x['alpha_2']: x['name'] for x in json.load(f)['3166-1']
+        }
+
+    for x in load_data(sources['regionmap']):
+        country_code, region_title = x.split('\t', 1)
+
+        if region_title == "Other":
+            continue
+
+        regions.setdefault(region_title, {
+            'title': region_title,
+            'countries': collections.OrderedDict(),
+            'country_codes': set()
+        })['country_codes'].add(country_code)
+
+    for x in load_data(sources['SUPPORTED']):
+        m = re_supported.match(x)
+
+        if m is None:
+            continue
+
+        country_code = m.group('country_code')
+        language_code = m.group('language_code')
+
+        countries[country_code] = {
+            'code': country_code,
+            'title': title_lookup[country_code],
+        }
+
+        # Don't add Denmark to shortlist for English (#276067)
+        if (language_code, country_code) == ('en', 'DK'):
+            continue
+
+        shortlist.setdefault(language_code, {})[country_code] = {
+            'title': title_lookup[country_code],
+            'country_code': country_code,
+            'language_code': language_code,
+        }
+
+    return {
+        'regions': regions,
+        'countries': countries,
+        'shortlist': shortlist,
+    }
+
+
+def parse_timezones(sources):
+    areas = {}
+    countries = {}
+
+    for x in load_data(sources['zone.tab']):
+        xs = x.split('\t')
+
+        country_code, timezone_code = xs[0], xs[2]
+
+        area_title, _, with_subarea = timezone_code.partition('/')
+        subarea_title, _, timezone_title = with_subarea.partition('/')
+
+        area = areas.setdefault(area_title, {
+            'title': area_title,
+            'subareas': {}
+        })
+
+        subarea = area['subareas'].setdefault(subarea_title, {
+            'title': subarea_title.replace('_', ' '),
+            'timezones': {},
+        })
+
+        subarea['timezones'].setdefault(timezone_code, {
+            'code': timezone_code,
+            'title': timezone_title.replace('_', ' ') or subarea['title'],
+        })
+
+        countries.setdefault(country_code, []).append(timezone_code)
+
+    for x in load_data(sources['tzmap.override']):
+        country_code, timezone = x.split(' ', 1)
+        countries[country_code] = [timezone]
+
+    return {
+        'areas': areas,
+        'countries': countries,
+    }
+
+
+class LocaleIndex(object):
+    """
+    Finds the value of the first wildcard in ``locales`` that matches a
+    locale, as per ``fnmatch``, using a single combined regular expression.
+    Only the ``*`` and ``?`` wildcards are supported.
+    """
+
+    def __init__(self, locales):
+        self.values = list(locales.values())
+
+        # An empty alternation would match everything
+        pattern = '|'.join(
+            '({})\\Z'.format(self.translate(x)) for x in locales
+        )
+        self.re = re.compile(pattern or '(?!)', re.DOTALL)
+
+    def translate(self, wildcard):
+        if '[' in wildcard:
+            raise ValueError("Unsupported wildcard: {}".format(wildcard))
+
+        return '.*'.join(
+            '.'.join(re.escape(y) for y in x.split('?'))
+            for x in wildcard.split('*')
+        )
+
+    def lookup(self, locale, default=None):
+        m = self.re.match(locale)
+
+        if m is None:
+            return default
+
+        # Each wildcard is exactly one group so this is also its index
+        return self.values[m.lastindex - 1]
+
+
+PARSERS = collections.OrderedDict((
+    ('keyboard', parse_keyboard),
+    ('languages', parse_languages),
+    ('countries', parse_countries),
+    ('timezones', parse_timezones),
+))
+
+
+def get_mtimes(sources):
+    mtimes = {}
+
+    for filename in sources.values():
+        st = os.stat(filename)
+        mtimes[filename] = (st.st_mtime_ns, st.st_size)
+
+    return mtimes
+
+
+def read_cache(mtimes):
+    try:
+        with open(CACHE_FILENAME, 'rb') as f:
+            cache = pickle.load(f)
+    except FileNotFoundError:
+        logger.info("No data cache found at %s", CACHE_FILENAME)
+        return None
+    except Exception:
+        logger.exception("Could not read data cache %s", CACHE_FILENAME)
+        return None
+
+    if cache.get('version') != CACHE_VERSION:
+        logger.info("Ignoring data cache with different version")
+        return None
+
+    if cache.get('mtimes') != mtimes:
+        logger.info("Ignoring data cache as source files have changed")
+        return None
+
+    return cache['data']
+
+
+def write_cache(mtimes, data):
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+
+        with atomic_write(CACHE_FILENAME, 'wb') as f:
+            pickle.dump({
+                'version': CACHE_VERSION,
+                'mtimes': mtimes,
+                'data': data,
+            }, f, pickle.HIGHEST_PROTOCOL)
+    except OSError as exc:
+        logger.warning(
+            "Could not write data cache %s: %s", CACHE_FILENAME, exc,
+        )
+        return
+
+    logger.info("Wrote data cache to %s", CACHE_FILENAME)
+
+
+def build(sources):
+    result = {}
+
+    for k, fn in PARSERS.items():
+        with timed('parse {}'.format(k)):
+            result[k] = fn(sources)
+
+    return result
+
+
+def load():
+    global _cache
+
+    if _cache is not None:
+        return _cache
+
+    xs = sources()
+    mtimes = get_mtimes(xs)
+
+    with timed('read data cache'):
+        _cache = read_cache(mtimes)
+
+    if _cache is None:
+        _cache = build(xs)
+        write_cache(mtimes, _cache)
+
+    return _cache
+
+
+def get(name):
+    return load()[name]
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    xs = sources()
+    write_cache(get_mtimes(xs), build(xs))
@@ -0,0 +1,87 @@
+import os
+import sys
+import logging
+import collections
+
+SYSFS = '/sys'
+
+# SMBIOS chassis types of portable machines: Portable, Laptop, Notebook, Hand
+# Held, Sub Notebook, Tablet, Convertible and Detachable.
+LAPTOP_CHASSIS_TYPES = frozenset({8, 9, 10, 11, 14, 30, 31, 32})
+
+Hardware = collections.namedtuple(
+    'Hardware',
+    ('chassis_type', 'has_battery', 'is_laptop'),
+)
+
+logger = logging.getLogger(__name__)
+
+_cache = {}
+
+
+def probe(sysfs=SYSFS):
+    """
+    Returns what we know about this machine, reading ``sysfs`` only once.
+    """
+
+    try:
+        return _cache[sysfs]
+    except KeyError:
+        pass
+
+    chassis_type = get_chassis_type(sysfs)
+    has_battery = get_has_battery(sysfs)
+
+    result = _cache[sysfs] = Hardware(
+        chassis_type,
+        has_battery,
+        chassis_type in LAPTOP_CHASSIS_TYPES or has_battery,
+    )
+
+    logger.info("Detected hardware: %r", result)
+
+    return result
+
+
+def get_chassis_type(sysfs):
+    filename = os.path.join(sysfs, 'class', 'dmi', 'id', 'chassis_type')
+
+    try:
+        with open(filename) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def get_has_battery(sysfs):
+    dirname = os.path.join(sysfs, 'class', 'power_supply')
+
+    try:
+        supplies = sorted(os.listdir(dirname))
+    except OSError:
+        return False
+
+    for x in supplies:
+        if read(os.path.join(dirname, x, 'type')) != 'Battery':
+            continue
+
+        # Ignore batteries of peripherals such as wireless mice
+        if read(os.path.join(dirname, x, 'scope')) == 'Device':
+            continue
+
+        return True
+
+    return False
+
+
+def read(filename):
+    try:
+        with open(filename) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+if __name__ == '__main__':
+    # eg. python3 -m firstboot.hardware [SYSFS]
+    print(probe(*sys.argv[1:]))
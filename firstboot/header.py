@@ -0,0 +1,121 @@
+import os
+import re
+import gi
+import sys
+import logging
+
+gi.require_version('GdkPixbuf', '2.0')
+
+from gi.repository import GdkPixbuf, GLib  # noqa: E402
+
+from .utils import CACHE_DIR, atomic_write, find_data  # noqa: E402
+from .profiling import timed  # noqa: E402
+
+re_cache_filename = re.compile(r'^header-\d+-\d+\.png$')
+
+logger = logging.getLogger(__name__)
+
+
+def get_cache_filename(width):
+    """
+    Returns where the header rendered at ``width`` pixels is cached. This
+    changes whenever the SVG is modified.
+    """
+
+    mtime = os.stat(find_data('header.svg')).st_mtime_ns
+
+    return os.path.join(CACHE_DIR, 'header-{}-{}.png'.format(width, mtime))
+
+
+def load(width):
+    """
+    Returns the header rendered at ``width`` pixels from our cache, or
+    ``None`` if it has not been rendered yet.
+    """
+
+    filename = get_cache_filename(width)
+
+    if not os.path.exists(filename):
+        logger.info("Header is not cached at %s", filename)
+        return None
+
+    with timed('load header'):
+        try:
+            return GdkPixbuf.Pixbuf.new_from_file(filename)
+        except GLib.Error as exc:
+            logger.warning(
+                "Could not load cached header %s: %s", filename, exc,
+            )
+
+    return None
+
+
+def render(width, keep=()):
+    """
+    Renders the header at ``width`` pixels, saving it to our cache in place
+    of any others except those in ``keep``. This is slow so should not be
+    called from the main loop.
+    """
+
+    with timed('render header'):
+        pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_scale(
+            find_data('header.svg'),
+            width,
+            -1,
+            True,
+        )
+
+    filename = get_cache_filename(width)
+
+    try:
+        _, buf = pixbuf.save_to_bufferv('png', [], [])
+
+        os.makedirs(CACHE_DIR, exist_ok=True)
+
+        with atomic_write(filename, 'wb') as f:
+            f.write(buf)
+    except (OSError, GLib.Error) as exc:
+        logger.warning("Could not write cached header %s: %s", filename, exc)
+        return pixbuf
+
+    logger.info("Wrote cached header to %s", filename)
+
+    prune({filename}.union(keep))
+
+    return pixbuf
+
+
+def prune(keep):
+    """
+    Removes headers cached for other widths or previous versions of the SVG,
+    except for the filenames in ``keep``.
+    """
+
+    try:
+        filenames = os.listdir(CACHE_DIR)
+    except OSError:
+        return
+
+    for x in filenames:
+        filename = os.path.join(CACHE_DIR, x)
+
+        if not re_cache_filename.match(x) or filename in keep:
+            continue
+
+        logger.info("Removing stale cached header %s", filename)
+
+        try:
+            os.unlink(filename)
+        except OSError as exc:
+            logger.warning("Could not remove %s: %s", filename, exc)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+
+    # Prerender for the given widths, eg. python3 -m firstboot.header 800
+    widths = [int(x) for x in sys.argv[1:]]
+    keep = [get_cache_filename(x) for x in widths]
+
+    for x in widths:
+        render(x, keep)
@@ -0,0 +1,174 @@
+import os
+import re
+import sys
+import logging
+import tempfile
+import functools
+import subprocess
+import collections
+import concurrent.futures
+
+from .utils import find_hooks, setup_logging
+from .profiling import Spans
+
+# Hooks may contain these headers within their first few lines, eg:
+#
+#   # firstboot-parallel: yes
+#   # firstboot-timeout: 60
+#
+# Consecutive hooks marked as parallel are run at the same time; any other hook
+# acts as a barrier and is run on its own once all previous hooks have
+# finished. A timeout of 0 disables the timeout for that hook.
+re_header = re.compile(r'^#\s*firstboot-(?P<key>[a-z-]+):\s*(?P<value>\S+)')
+
+# As per run-parts(8)
+re_valid_name = re.compile(r'^[a-zA-Z0-9_-]+$')
+
+HEADER_LINES = 10
+DEFAULT_TIMEOUT = 300
+
+Hook = collections.namedtuple('Hook', ('name', 'path', 'parallel', 'timeout'))
+
+logger = logging.getLogger(__name__)
+
+
+class HookError(RuntimeError):
+    """
+    Raised when one or more hooks fail. By then, the settings have already
+    been applied so they should not be applied again.
+    """
+
+
+def find(name):
+    dirname = find_hooks(name)
+
+    for x in sorted(os.listdir(dirname)):
+        path = os.path.join(dirname, x)
+
+        if re_valid_name.match(x) is None:
+            logger.debug("Skipping hook with invalid name %s", path)
+            continue
+
+        if not os.path.isfile(path) or not os.access(path, os.X_OK):
+            logger.debug("Skipping non-executable hook %s", path)
+            continue
+
+        headers = parse_headers(path)
+
+        timeout = int(headers.get('timeout', DEFAULT_TIMEOUT)) or None
+
+        yield Hook(x, path, headers.get('parallel') == 'yes', timeout)
+
+
+def parse_headers(path):
+    headers = {}
+
+    with open(path, errors='ignore') as f:
+        for _, line in zip(range(HEADER_LINES), f):
+            m = re_header.match(line)
+
+            if m is not None:
+                headers[m.group('key')] = m.group('value')
+
+    return headers
+
+
+def group(hooks):
+    """
+    Splits hooks into groups that may be run concurrently.
+    """
+
+    result = []
+
+    for x in hooks:
+        if x.parallel and result and result[-1][-1].parallel:
+            result[-1].append(x)
+        else:
+            result.append([x])
+
+    return result
+
+
+def run_hooks(name, no_act=False, spans=None, before_group=None):
+    """
+    Runs the hooks in ``name``, recording each of them in ``spans``.
+
+    ``before_group`` is called before each group of hooks is started, eg. so
+    that state can be saved before a hook reboots the system.
+    """
+
+    failed = []
+
+    if spans is None:
+        spans = Spans()
+
+    fn = functools.partial(run_hook, spans=spans)
+
+    for hooks in group(find(name)):
+        if no_act:
+            for x in hooks:
+                logger.info("Not running hook %s", x.path)
+            continue
+
+        if before_group is not None:
+            before_group()
+
+        if len(hooks) == 1:
+            results = [fn(hooks[0])]
+        else:
+            with concurrent.futures.ThreadPoolExecutor(len(hooks)) as executor:
+                results = list(executor.map(fn, hooks))
+
+        failed.extend(x.name for x, ok in zip(hooks, results) if not ok)
+
+    if failed:
+        raise HookError("Hook(s) in {} failed: {}".format(
+            name,
+            ', '.join(failed),
+        ))
+
+
+def run_hook(hook, spans):
+    logger.info("Running hook %s (timeout: %ss)", hook.path, hook.timeout)
+
+    # Capture output via a file rather than a pipe as hooks may leave
+    # processes running in the background that would keep a pipe open.
+    with spans.span('hook {}'.format(hook.name)), \
+            tempfile.TemporaryFile() as f:
+        returncode = None
+
+        try:
+            returncode = subprocess.call(
+                (hook.path,),
+                stdout=f,
+                stderr=subprocess.STDOUT,
+                timeout=hook.timeout,
+            )
+        except subprocess.TimeoutExpired:
+            logger.error("Hook %s timed out", hook.name)
+        finally:
+            f.seek(0)
+            output = f.read()
+
+            for x in output.decode('utf-8', 'replace').splitlines():
+                logger.info("  %s", x)
+
+            spans.record_command(returncode, len(output))
+
+    if returncode is None:
+        return False
+
+    logger.info("Hook %s exited with return code %s", hook.name, returncode)
+
+    return returncode == 0
+
+
+def main():
+    setup_logging(False)
+
+    for x in sys.argv[1:]:
+        run_hooks(x)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+import logging
+import concurrent.futures
+
+from gi.repository import GLib
+
+logger = logging.getLogger(__name__)
+
+
+class Loader(object):
+    """
+    Runs functions on a worker thread, handing their results back to the GTK
+    main loop.
+    """
+
+    def __init__(self):
+        self.futures = {}
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+    def submit(self, name, fn, *args):
+        logger.debug("Loading %s in the background", name)
+
+        self.futures[name] = self.executor.submit(fn, *args)
+
+    def when_ready(self, name, callback, errback=None):
+        """
+        Calls ``callback`` with the result of ``name`` from the main loop once
+        it is available, or ``errback`` with the exception if it could not be
+        loaded.
+        """
+
+        def on_done(future):
+            GLib.idle_add(self.on_idle_ready, name, future, callback, errback)
+
+        self.futures[name].add_done_callback(on_done)
+
+    def on_idle_ready(self, name, future, callback, errback):
+        try:
+            result = future.result()
+        except Exception as exc:
+            logger.exception("Exception caught whilst loading %s:", name)
+
+            if errback is not None:
+                errback(exc)
+        else:
+            logger.debug("Finished loading %s", name)
+            callback(result)
+
+        return False
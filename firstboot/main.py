@@ -1,21 +1,62 @@
 import os
 import sys
+import cProfile
 import logging
+import argparse
 
-from gi.repository import Gtk
-
-from .assistant import Assistant
 from .utils import setup_logging
+from .profiling import timed
 
 log = logging.getLogger(__name__)
 
 
 def main():
+    # Write cProfile output to this file, eg. for use with snakeviz
+    filename = os.environ.get('FIRSTBOOT_PROFILE')
+
+    if not filename:
+        return run()
+
+    profile = cProfile.Profile()
+
+    try:
+        return profile.runcall(run)
+    finally:
+        log.info("Writing profile to %s", filename)
+        profile.dump_stats(filename)
+
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--preseed',
+        metavar='FILE',
+        help="apply the settings in FILE without showing the GUI",
+    )
+    args = parser.parse_args()
+
     development = os.environ.get('FIRSTBOOT_DEVELOPMENT_MODE') == '1'
     setup_logging(development)
 
+    if args.preseed:
+        log.info(
+            "Starting firstboot without GUI (development mode: %s)",
+            development,
+        )
+
+        # Avoid importing GTK
+        from .preseed import main as preseed_main
+
+        sys.exit(preseed_main(args.preseed, development))
+
+    with timed('import'):
+        from .assistant import Assistant
+        from gi.repository import Gtk
+
     log.info("Starting firstboot (development mode: %s)", development)
-    assistant = Assistant(development)
+
+    with timed('construct window'):
+        assistant = Assistant(development)
 
     log.debug("Showing GUI")
     assistant.show_all()
@@ -1,19 +1,76 @@
 import re
 
-from gi.repository import Gtk
+from gi.repository import Gtk, GLib
+
+from ..search import SearchIndex
+from ..validation import ValidationError
 
 LABEL_PADDING = 25
 
+# Milliseconds to wait after the last edit before rendering validation errors
+VALIDATION_DELAY = 250
+
 
 class Page(Gtk.Box):
+    # Name of the firstboot.data set this page needs, if any. It is loaded in
+    # the background and passed to ``populate`` once available.
+    dataset = None
+
     def __init__(self, name, assistant):
         self.name = name
         self.assistant = assistant
 
         self.complete = False
+        self.ready = self.dataset is None
+        self.placeholder = None
+        self.validation_label = None
+        self.validation_source = None
 
         Gtk.Box.__init__(self, orientation=Gtk.Orientation.VERTICAL)
 
+        if not self.ready:
+            assistant.loader.when_ready(
+                self.dataset,
+                self.on_loaded,
+                self.on_load_failed,
+            )
+
+    def on_loaded(self, data):
+        self.populate(data)
+        self.ready = True
+
+        if self.placeholder is not None:
+            self.placeholder.set_visible_child_name('ready')
+
+        self.assistant.on_page_ready(self)
+
+    def on_load_failed(self, exc):
+        # We will never become ready, so replace the spinner with the error
+        if self.placeholder is not None:
+            label = self.create_label(
+                "<b>Could not load {}:</b> {}".format(
+                    GLib.markup_escape_text(self.dataset),
+                    GLib.markup_escape_text(str(exc)),
+                ),
+            )
+            label.show()
+
+            self.placeholder.add_named(label, 'error')
+            self.placeholder.set_visible_child_name('error')
+
+        self.assistant.on_page_load_failed(self, exc)
+
+    def populate(self, data):
+        pass
+
+    def changed(self):
+        """
+        Should be called whenever the result of ``get_apply_data`` may have
+        changed.
+        """
+
+        self.assistant.state.changed(self)
+
     def get_apply_data(self):
         return {}
 
@@ -39,13 +96,54 @@ class Page(Gtk.Box):
         try:
             self.validate(self.get_apply_data())
         except ValidationError as exc:
-            label.set_markup(str(exc))
+            markup = str(exc)
+        else:
+            markup = ''
+
+        # Avoid relayouting the label if nothing has changed
+        if label.get_label() != markup:
+            label.set_markup(markup)
+
+        return not markup
+
+    def schedule_validation(self, label):
+        """
+        Updates whether this page is complete immediately but only renders
+        validation errors into ``label`` once the user has stopped typing.
+        """
+
+        self.assistant.set_page_complete(self, self.is_valid())
+
+        self.cancel_validation()
+        self.validation_label = label
+        self.validation_source = GLib.timeout_add(
+            VALIDATION_DELAY,
+            self.on_validation_timeout,
+        )
+
+    def cancel_validation(self):
+        if self.validation_source is None:
             return False
 
-        label.set_markup('')
+        GLib.source_remove(self.validation_source)
+        self.validation_source = None
 
         return True
 
+    def flush_validation(self):
+        """
+        Renders any pending validation errors straight away.
+        """
+
+        if self.cancel_validation():
+            self.render_validation_errors(self.validation_label)
+
+    def on_validation_timeout(self):
+        self.validation_source = None
+        self.render_validation_errors(self.validation_label)
+
+        return False
+
     def create_label(self, markup='', *args, **kwargs):
         markup = markup.strip()
 
@@ -62,6 +160,146 @@ class Page(Gtk.Box):
 
         return label
 
+    def create_placeholder(self, widget):
+        """
+        Wraps ``widget`` so that a spinner is shown until our data is ready,
+        or an error if it could not be loaded.
+        """
+
+        self.placeholder = Gtk.Stack()
+        self.placeholder.add_named(Gtk.Spinner(active=True), 'loading')
+        self.placeholder.add_named(widget, 'ready')
+
+        return self.placeholder
+
+
+class SearchPage(Page):
+    """
+    A page showing a tree of rows that can be searched, via ``treeview``.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.filter = None
+        self.search_entry = None
+        self.search_index = SearchIndex()
+        self.search_column = None
+        self.search_visible = None
+
+        super().__init__(*args, **kwargs)
+
+    def create_search(self, treeview, column):
+        """
+        Wraps ``treeview`` with an entry that filters its rows using our
+        ``search_index``. The key of each row in the index should be stored
+        in ``column`` of its model.
+
+        Call ``set_search_model`` once the model has been populated.
+        """
+
+        self.search_column = column
+
+        self.search_entry = Gtk.SearchEntry()
+        self.search_entry.connect('changed', self.on_search_changed)
+        self.search_entry.connect('activate', self.on_search_activate)
+
+        scroll = Gtk.ScrolledWindow()
+        scroll.add(treeview)
+
+        vbox = Gtk.VBox(spacing=6)
+        vbox.pack_start(self.search_entry, False, False, 0)
+        vbox.pack_start(scroll, True, True, 0)
+
+        return vbox
+
+    def set_search_model(self, model):
+        """
+        Shows ``model`` via a filter. This should be done after the model has
+        been populated to avoid filtering each row as it is added.
+        """
+
+        self.filter = model.filter_new()
+        self.filter.set_visible_func(self.is_search_visible)
+
+        self.treeview.set_model(self.filter)
+
+    def is_search_visible(self, model, it, data):
+        if self.search_visible is None:
+            return True
+
+        return model[it][self.search_column] in self.search_visible
+
+    def on_search_changed(self, entry):
+        self.search_visible = self.search_index.search(entry.get_text())
+        self.filter.refilter()
+
+        if self.search_visible is not None:
+            self.treeview.expand_all()
+            return
+
+        # Search was cleared; only show the selected row, if any
+        self.treeview.collapse_all()
+
+        model, it = self.treeview.get_selection().get_selected()
+        if it is not None:
+            path = model.get_path(it)
+            self.treeview.expand_to_path(path)
+            self.treeview.scroll_to_cell(path, None, True, 0.5, 0)
+
+    def on_search_activate(self, entry):
+        self.treeview.grab_focus()
+
+    def clear_search(self):
+        self.search_entry.set_text('')
+
+    def get_filter_iter(self, it):
+        """
+        Returns the iter in our filter for ``it``, an iter of the underlying
+        model, or ``None`` if it is not currently visible.
+        """
+
+        valid, filter_it = self.filter.convert_child_iter_to_iter(it)
+
+        return filter_it if valid else None
+
+
+class ShortlistPage(SearchPage):
+    """
+    A page whose ``model`` has (code, title, search key) rows: a shortlist
+    followed by an "Other" row (``other_it``) containing every code.
+
+    Only the shortlist changes between visits, so subclasses build the rest
+    of their model once, in ``populate``, recording the row of each code in
+    ``tree_iters``.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.iters = {}
+        self.other_it = None
+        self.tree_iters = {}
+        self.shortlist_iters = {}
+
+        super().__init__(*args, **kwargs)
+
+    def replace_shortlist(self, rows):
+        """
+        Replaces the rows shown before ``other_it`` with ``rows``, a list of
+        (code, title) pairs.
+
+        Afterwards, ``iters`` maps each code to its row, preferring those in
+        the shortlist over those in ``tree_iters``.
+        """
+
+        for x in self.shortlist_iters.values():
+            self.search_index.remove(self.model[x][self.search_column])
+            self.model.remove(x)
+
+        self.shortlist_iters = {}
+
+        for code, title in rows:
+            key = self.search_index.add(None, code, title)
+            self.shortlist_iters[code] = self.model.insert_before(
+                None, self.other_it, [code, title, key],
+            )
 
-class ValidationError(Exception):
-    pass
+        self.iters = dict(self.tree_iters)
+        self.iters.update(self.shortlist_iters)
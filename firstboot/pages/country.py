@@ -1,13 +1,8 @@
-import re
-import json
 import operator
-import collections
 
 from gi.repository import Gtk, Gdk
 
-from ..utils import find_data, load_data
-
-from .base import Page, LABEL_PADDING
+from .base import ShortlistPage, LABEL_PADDING
 
 LABEL = """
 <b>Select your location.</b>
@@ -18,67 +13,27 @@ live.
 """
 
 cmp_title = operator.itemgetter('title')
-re_supported = re.compile(
-    r'^(?P<language_code>[^_]+)_(?P<country_code>[^@. ]+)'
-)
 
 
-class Country(Page):
+class Country(ShortlistPage):
+    dataset = 'countries'
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
         label = self.create_label(LABEL)
 
-        self.model = Gtk.TreeStore(str, str)
-        self.iters = {}
+        # code, title, search key
+        self.model = Gtk.TreeStore(str, str, int)
         self.selected = None
 
-        self.regions = collections.OrderedDict()
-        self.defaults = {'en': 'US'} # FIXME we can do this properly from languagelist
-        self.countries = collections.OrderedDict()
-        self.shortlist = {}
-
-        # Parse data
-        with open('/usr/share/iso-codes/json/iso_3166-1.json') as f:
-            title_lookup = {
-                x['alpha_2']: x['name'] for x in json.load(f)['3166-1']
-            }
-
-        for x in load_data(find_data('regionmap')):
-            country_code, region_title = x.split('\t', 1)
-
-            if region_title == "Other":
-                continue
+        self.shortlist_language = None
 
-            self.regions.setdefault(region_title, {
-                'title': region_title,
-                'countries': collections.OrderedDict(),
-                'country_codes': set()
-            })['country_codes'].add(country_code)
-
-        for x in load_data('/usr/share/i18n/SUPPORTED'):
-            m = re_supported.match(x)
-
-            if m is None:
-                continue
-
-            country_code = m.group('country_code')
-            language_code = m.group('language_code')
-
-            self.countries[country_code] = {
-                'code': country_code,
-                'title': title_lookup[country_code],
-            }
-
-            # Don't add Denmark to shortlist for English (#276067)
-            if (language_code, country_code) == ('en', 'DK'):
-                continue
+        self.defaults = {'en': 'US'} # FIXME we can do this properly from languagelist
 
-            self.shortlist.setdefault(language_code, {})[country_code] = {
-                'title': title_lookup[country_code],
-                'country_code': country_code,
-                'language_code': language_code,
-            }
+        self.regions = {}
+        self.countries = {}
+        self.shortlist = {}
 
         self.treeview = Gtk.TreeView(self.model, headers_visible=False)
         self.treeview.connect('row-activated', self.on_row_activated)
@@ -91,58 +46,78 @@ class Country(Page):
         column = Gtk.TreeViewColumn("", renderer, text=1)
         self.treeview.append_column(column)
 
-        scroll = Gtk.ScrolledWindow()
-        scroll.add(self.treeview)
+        search = self.create_search(self.treeview, 2)
 
         vbox = Gtk.VBox()
         vbox.pack_start(label, False, False, LABEL_PADDING)
-        vbox.pack_start(scroll, True, True, 0)
+        vbox.pack_start(self.create_placeholder(search), True, True, 0)
         self.pack_start(vbox, True, True, 0)
 
-    def get_apply_data(self):
-        return {
-            'country': self.selected,
+    def populate(self, data):
+        self.regions = data['regions']
+        self.countries = data['countries']
+        self.shortlist = {
+            k: sorted(v.values(), key=cmp_title)
+            for k, v in data['shortlist'].items()
         }
 
-    def on_switch(self):
-        selection = self.treeview.get_selection()
-        selection.handler_block(self.change_handler)
-
-        # Populate model
-        self.model.clear()
-        self.iters = {}
+        self.treeview.set_model(None)
 
-        # eg. zh_CN -> zh
-        default_language, _, _ = self.assistant \
-            .get_all_apply_data()['language'].partition('_')
+        other_key = self.search_index.add(None, "Other")
+        self.other_it = self.model.append(None, [None, "Other", other_key])
 
-        try:
-            shortlist = self.shortlist[default_language]
-        except KeyError:
-            shortlist = self.shortlist['en']
-
-        for country in sorted(shortlist.values(), key=cmp_title):
-            self.iters[country['country_code']] = self.model.append(
-                None, [country['country_code'], country['title']],
-            )
-
-        other_it = self.model.append(None, [None, "Other"])
+        countries = sorted(self.countries.values(), key=cmp_title)
 
         # Loop over all regions...
         for region in sorted(self.regions.values(), key=cmp_title):
-            region_it = self.model.append(other_it, [None, region['title']])
+            region_key = self.search_index.add(other_key, region['title'])
+            region_it = self.model.append(
+                self.other_it, [None, region['title'], region_key],
+            )
 
             # ... then all countries, skipping ones that don't match the region
-            for country in sorted(self.countries.values(), key=cmp_title):
+            for country in countries:
                 if country['code'] not in region['country_codes']:
                     continue
 
+                key = self.search_index.add(
+                    region_key, country['code'], country['title'],
+                )
                 country_it = self.model.append(
-                    region_it, [country['code'], country['title']],
+                    region_it, [country['code'], country['title'], key],
                 )
 
-                # Don't overwrite iter in shortlist
-                self.iters.setdefault(country['code'], country_it)
+                self.tree_iters.setdefault(country['code'], country_it)
+
+        self.set_search_model(self.model)
+
+    def get_apply_data(self):
+        return {
+            'country': self.selected,
+        }
+
+    def on_switch(self):
+        self.clear_search()
+
+        selection = self.treeview.get_selection()
+        selection.handler_block(self.change_handler)
+
+        # eg. zh_CN -> zh
+        default_language, _, _ = self.assistant \
+            .get_all_apply_data()['language'].partition('_')
+
+        shortlist_language = default_language
+        if shortlist_language not in self.shortlist:
+            shortlist_language = 'en'
+
+        shortlist = self.shortlist[shortlist_language]
+
+        # Replace the shortlist rows if the language has changed
+        if shortlist_language != self.shortlist_language:
+            self.shortlist_language = shortlist_language
+            self.replace_shortlist(
+                [(x['country_code'], x['title']) for x in shortlist],
+            )
 
         # Grab focus prior to unblocking change handler
         self.treeview.grab_focus()
@@ -155,7 +130,9 @@ class Country(Page):
                 self.selected = self.defaults[default_language]
             except KeyError:
                 if len(shortlist) == 1:
-                    self.selected = list(shortlist.values())[0]['country_code']
+                    self.selected = shortlist[0]['country_code']
+
+            self.changed()
 
         self.treeview.get_selection().unselect_all()
         self.assistant.set_page_complete(self, bool(self.selected))
@@ -163,8 +140,8 @@ class Country(Page):
         if not self.selected:
             return
 
-        it = self.iters[self.selected]
-        path = self.model.get_path(it)
+        it = self.get_filter_iter(self.iters[self.selected])
+        path = self.filter.get_path(it)
         self.treeview.expand_to_path(path)
         self.treeview.scroll_to_cell(path, None, True, 0.5, 0)
         self.treeview.get_selection().select_iter(it)
@@ -173,19 +150,23 @@ class Country(Page):
         model, treeiter = selection.get_selected()
         if treeiter:
             self.selected = model[treeiter][0]
+            self.changed()
         self.assistant.set_page_complete(self, bool(self.selected))
 
         # Reset stuff if we pressed 'Back'
         timezone_page = \
             self.assistant.pages['firstboot.pages.timezone.Timezone']
         timezone_page.selected = None
+        timezone_page.changed()
 
         keyboard_page = \
             self.assistant.pages['firstboot.pages.keyboard.Keyboard']
         keyboard_page.selected = None
+        keyboard_page.changed()
 
     def on_row_activated(self, treeview, path, column):
-        self.selected = self.model.get_value(self.model.get_iter(path), 0)
+        self.selected = self.filter.get_value(self.filter.get_iter(path), 0)
+        self.changed()
 
         if self.selected:
             self.assistant.notebook.next_page()
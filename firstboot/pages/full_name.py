@@ -1,6 +1,8 @@
 from gi.repository import Gtk, Gdk
 
-from .base import Page, ValidationError, LABEL_PADDING
+from ..validation import validate_full_name
+
+from .base import Page, LABEL_PADDING
 
 LABEL = """
 <b>Please enter your full name.</b>
@@ -34,20 +36,23 @@ class FullName(Page):
         }
 
     def validate(self, data):
-        if not data['full_name']:
-            raise ValidationError("Name cannot be blank.")
+        validate_full_name(data)
 
     def on_switch(self):
         if not self.get_apply_data()['full_name']:
             self.entry.grab_focus()
 
     def on_entry_changed(self, entry):
-        is_valid = self.render_validation_errors(self.errors)
-
-        self.assistant.set_page_complete(self, is_valid)
+        self.changed()
+        self.schedule_validation(self.errors)
 
     def on_key_press_event(self, widget, event):
-        if event.keyval == Gdk.KEY_Return and self.is_valid():
+        if event.keyval != Gdk.KEY_Return:
+            return False
+
+        self.flush_validation()
+
+        if self.is_valid():
             self.assistant.notebook.next_page()
             return True
 
@@ -1,8 +1,9 @@
-import re
-import subprocess
-
 from gi.repository import Gtk, Gdk
 
+from .. import hardware
+from ..validation import HOSTNAME_MAX_LENGTH, HOSTNAME_MIN_LENGTH, \
+    validate_hostname
+
 from .base import Page, ValidationError, LABEL_PADDING
 
 LABEL = """
@@ -11,15 +12,13 @@ LABEL = """
 
 
 class Hostname(Page):
-    re_valid = re.compile(r'^[a-z][-a-z0-9_]*$')
-
-    min_length = 2
-    max_length = 32
+    min_length = HOSTNAME_MIN_LENGTH
+    max_length = HOSTNAME_MAX_LENGTH
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-        self.is_laptop = bool(subprocess.call('laptop-detect') == 0)
+        self.is_laptop = hardware.probe().is_laptop
 
         label = self.create_label(LABEL)
 
@@ -43,24 +42,11 @@ class Hostname(Page):
         }
 
     def validate(self, data):
-        val = data['hostname']
-
-        if not val:
-            raise ValidationError("Hostname cannot be blank.")
-
-        if len(val) > self.max_length:
-            raise ValidationError("Hostname is too long.")
-
-        if val in {'localhost'}:
-            raise ValidationError("This hostname is reserved.")
-
-        if self.re_valid.match(val) is None:
-            raise ValidationError("Hostname contains invalid characters.")
+        validate_hostname(data)
 
     def on_entry_changed(self, entry):
-        is_valid = self.render_validation_errors(self.errors)
-
-        self.assistant.set_page_complete(self, is_valid)
+        self.changed()
+        self.schedule_validation(self.errors)
 
     def on_switch(self):
         if self.get_apply_data()['hostname']:
@@ -86,7 +72,12 @@ class Hostname(Page):
         if event.keyval == Gdk.KEY_space:
             return True
 
-        if event.keyval == Gdk.KEY_Return and self.is_valid():
+        if event.keyval != Gdk.KEY_Return:
+            return False
+
+        self.flush_validation()
+
+        if self.is_valid():
             self.assistant.notebook.next_page()
             return True
 
@@ -1,78 +1,27 @@
-import fnmatch
-import collections
-
 from gi.repository import Gtk, Gdk
 
-from ..utils import find_data, load_data
+from ..data import LocaleIndex
 
-from .base import Page, LABEL_PADDING
+from .base import SearchPage, LABEL_PADDING
 
 LABEL = """
 <b>Please select your keyboard layout</b>
 """
 
 
-class Keyboard(Page):
+class Keyboard(SearchPage):
+    dataset = 'keyboard'
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
         self.iters = {}
-        self.model = Gtk.TreeStore(str, str, str)
+        # layout, variant, title, search key
+        self.model = Gtk.TreeStore(str, str, str, int)
         self.selected = None
 
-        self.locales = collections.OrderedDict()
-        self.layouts = collections.OrderedDict()
-
-        for x in load_data(find_data('kbdnames')):
-            lang, type_, layout_code, data = x.split('*', 3)
-
-            if lang != 'C':
-                continue
-
-            if type_ == 'layout':
-                self.layouts[layout_code] = {
-                    'code': layout_code,
-                    'title': data,
-                    'variants': collections.OrderedDict(),
-                }
-            elif type_ == 'variant':
-                variant_code, title = data.split('*', 1)
-
-                if not variant_code:
-                    continue
-
-                parent = self.layouts[layout_code]
-                title = title.replace("{title} - ".format(**parent), '')
-
-                parent['variants'][variant_code] = {
-                    'code': variant_code,
-                    'title': title,
-                }
-
-        for x in load_data(find_data('keyboard-configuration')):
-            wildcard, _, data = x.partition('\t')
-            layout_codes, _, variant_code = data.partition('\t')
-            layout_code, _, _ = layout_codes.partition(',')
-            variant_code = variant_code.replace(',', '')
-
-            try:
-                self.layouts[layout_code][variant_code]
-                self.locales[wildcard] = (layout_code, variant_code)
-            except KeyError:
-                pass
-
-        # Populate model
-        for layout in self.layouts.values():
-            it = self.model.append(None, [layout['code'], '', layout['title']])
-
-            self.iters[(layout['code'], '')] = it
-
-            for variant in layout['variants'].values():
-                key = layout['code'], variant['code']
-
-                self.iters[key] = self.model.append(
-                    it, [layout['code'], variant['code'], variant['title']],
-                )
+        self.layouts = {}
+        self.locales = LocaleIndex({})
 
         self.treeview = Gtk.TreeView(self.model, headers_visible=False)
         self.treeview.connect('row-activated', self.on_row_activated)
@@ -85,16 +34,48 @@ class Keyboard(Page):
         column = Gtk.TreeViewColumn("", renderer, text=2)
         self.treeview.append_column(column)
 
-        scroll = Gtk.ScrolledWindow()
-        scroll.add(self.treeview)
+        search = self.create_search(self.treeview, 3)
 
         label = self.create_label(LABEL)
 
         vbox = Gtk.VBox()
         vbox.pack_start(label, False, False, LABEL_PADDING)
-        vbox.pack_start(scroll, True, True, 0)
+        vbox.pack_start(self.create_placeholder(search), True, True, 0)
         self.pack_start(vbox, True, True, 0)
 
+    def populate(self, data):
+        self.layouts = data['layouts']
+        self.locales = LocaleIndex(data['locales'])
+
+        self.treeview.set_model(None)
+
+        # Populate model
+        for layout in self.layouts.values():
+            layout_key = self.search_index.add(
+                None, layout['code'], layout['title'],
+            )
+
+            it = self.model.append(
+                None, [layout['code'], '', layout['title'], layout_key],
+            )
+
+            self.iters[(layout['code'], '')] = it
+
+            for variant in layout['variants'].values():
+                key = self.search_index.add(
+                    layout_key, variant['code'], variant['title'],
+                )
+
+                self.iters[layout['code'], variant['code']] = \
+                    self.model.append(it, [
+                        layout['code'],
+                        variant['code'],
+                        variant['title'],
+                        key,
+                    ])
+
+        self.set_search_model(self.model)
+
     def get_apply_data(self):
         return {
             'keyboard_layout': self.selected[0] if self.selected else None,
@@ -102,6 +83,7 @@ class Keyboard(Page):
         }
 
     def on_switch(self):
+        self.clear_search()
         self.treeview.grab_focus()
 
         # Try and determine a default
@@ -111,33 +93,30 @@ class Keyboard(Page):
             # FIXME: use the field in languagelist
             locale = '{language}_{country}'.format(**data)
 
-            # Set a fallback
-            self.selected = ('us', '')
+            # Use the first matching wildcard, with a fallback
+            self.selected = self.locales.lookup(locale, ('us', ''))
+            self.changed()
 
-            for k, v in self.locales.items():
-                if not fnmatch.fnmatch(locale, k):
-                    continue
-
-                self.selected = v
-                break
-
-        it = self.iters[self.selected]
-        path = self.model.get_path(it)
+        it = self.get_filter_iter(self.iters[self.selected])
+        path = self.filter.get_path(it)
         self.treeview.get_selection().select_iter(it)
         self.treeview.scroll_to_cell(path, None, True, 0.5, 0)
 
     def on_changed(self, selection):
         model, treeiter = selection.get_selected()
-        self.selected = None
+
+        # Keep our selection if it was just hidden by searching
         if treeiter:
             self.selected = model[treeiter][0], model[treeiter][1]
+            self.changed()
         self.assistant.set_page_complete(self, bool(self.selected))
 
     def on_row_activated(self, treeview, path, column):
-        it = self.model.get_iter(path)
-        value = self.model.get_value(it, 0), self.model.get_value(it, 1)
+        it = self.filter.get_iter(path)
+        value = self.filter.get_value(it, 0), self.filter.get_value(it, 1)
 
         self.selected = value
+        self.changed()
         self.assistant.notebook.next_page()
 
     def on_key_press_event(self, widget, event):
@@ -1,9 +1,5 @@
-import collections
-
 from gi.repository import Gtk, Gdk
 
-from ..utils import find_data, load_data
-
 from .base import Page, LABEL_PADDING
 
 LABEL = """
@@ -14,6 +10,8 @@ This will be used for the default language on the installed system.
 
 
 class Language(Page):
+    dataset = 'languages'
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -21,33 +19,8 @@ class Language(Page):
 
         self.model = Gtk.ListStore(str, str, str)
         self.selected = 'en'
-        self.languages = collections.OrderedDict()
-
-        for line in load_data(find_data('languagelist')):
-            parsed = dict(zip((
-                'langcode',
-                'language_en',
-                'language_orig',
-                'supported_environments',
-                'countrycode',
-                'fallbacklocale',
-                'langlist',
-                'console-setup',
-            ), line.split(';')))
-
-            self.languages[parsed['langcode']] = parsed
-
-        for x in self.languages.values():
-            # Don't allow the "C" locale to be selected.
-            if x['langcode'] == 'C':
-                continue
-
-            x['iter'] = self.model.append((
-                x['langcode'],
-                x['language_en'],
-                x['language_orig']
-                if x['language_orig'] != x['language_en'] else '',
-            ))
+        self.iters = {}
+        self.languages = {}
 
         self.treeview = Gtk.TreeView(self.model, headers_visible=False)
         self.treeview.connect('row-activated', self.on_row_activated)
@@ -66,16 +39,31 @@ class Language(Page):
 
         vbox = Gtk.VBox()
         vbox.pack_start(label, False, False, LABEL_PADDING)
-        vbox.pack_start(scroll, True, True, 0)
+        vbox.pack_start(self.create_placeholder(scroll), True, True, 0)
         self.pack_start(vbox, True, True, 0)
 
+    def populate(self, data):
+        self.languages = data
+
+        for x in self.languages.values():
+            # Don't allow the "C" locale to be selected.
+            if x['langcode'] == 'C':
+                continue
+
+            self.iters[x['langcode']] = self.model.append((
+                x['langcode'],
+                x['language_en'],
+                x['language_orig']
+                if x['language_orig'] != x['language_en'] else '',
+            ))
+
     def get_apply_data(self):
         return {
             'language': self.selected,
         }
 
     def on_switch(self):
-        it = self.languages[self.selected]['iter']
+        it = self.iters[self.selected]
         path = self.model.get_path(it)
 
         self.treeview.grab_focus()
@@ -86,11 +74,13 @@ class Language(Page):
         model, treeiter = selection.get_selected()
         if treeiter:
             self.selected = model[treeiter][0]
+            self.changed()
 
             # Reset region if we pressed 'Back'
             country_page = \
                 self.assistant.pages['firstboot.pages.country.Country']
             country_page.selected = None
+            country_page.changed()
 
         self.assistant.set_page_complete(self, bool(self.selected))
 
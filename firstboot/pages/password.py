@@ -1,6 +1,9 @@
 from gi.repository import Gtk, Gdk
 
-from .base import Page, ValidationError, LABEL_PADDING
+from ..validation import PASSWORD_MAX_LENGTH, PASSWORD_MIN_LENGTH, \
+    validate_password
+
+from .base import Page, LABEL_PADDING
 
 LABEL = """
 <b>Choose a password for the new user.</b>
@@ -11,8 +14,8 @@ should be changed at regular intervals.
 
 
 class Password(Page):
-    max_length = 40
-    min_length = 6
+    max_length = PASSWORD_MAX_LENGTH
+    min_length = PASSWORD_MIN_LENGTH
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -45,30 +48,15 @@ class Password(Page):
         }
 
     def validate(self, data):
-        if not data['password']:
-            if data['password_confirm']:
-                raise ValidationError("Please enter a password.")
-            raise ValidationError("Password cannot be blank.")
-
-        if len(data['password']) < self.min_length:
-            raise ValidationError(
-                "Password is too short. Please choose a value at least {} "
-                "characters in length".format(self.min_length),
-            )
-
-        if len(data['password']) > self.max_length:
-            raise ValidationError("Password is too long.")
-
-        if data['password'] != data['password_confirm']:
-            raise ValidationError("Passwords do not match.")
+        validate_password(data)
 
     def on_any_entry_changed(self, entry):
+        self.changed()
+
         if entry == self.entry:
-            is_valid = self.is_valid()
+            self.assistant.set_page_complete(self, self.is_valid())
         else:
-            is_valid = self.render_validation_errors(self.errors)
-
-        self.assistant.set_page_complete(self, is_valid)
+            self.schedule_validation(self.errors)
 
     def on_key_press_event(self, widget, event):
         if event.keyval != Gdk.KEY_Return:
@@ -77,6 +65,8 @@ class Password(Page):
         if widget == self.entry and self.entry.get_text():
             self.entry_confirm.grab_focus()
         else:
+            self.flush_validation()
+
             if self.is_valid():
                 self.assistant.notebook.next_page()
 
@@ -1,13 +1,8 @@
-import re
-import json
 import operator
-import collections
 
 from gi.repository import Gtk, Gdk
 
-from ..utils import find_data, load_data
-
-from .base import Page, LABEL_PADDING
+from .base import ShortlistPage, LABEL_PADDING
 
 LABEL = """
 <b>Select your timezone.</b>
@@ -16,52 +11,25 @@ LABEL = """
 cmp_title = operator.itemgetter('title')
 
 
-class Timezone(Page):
+class Timezone(ShortlistPage):
+    dataset = 'timezones'
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
         label = self.create_label(LABEL)
 
-        self.model = Gtk.TreeStore(str, str)
-        self.iters = {}
+        # code, title, search key
+        self.model = Gtk.TreeStore(str, str, int)
         self.selected = None
 
+        self.order = {}
+        self.titles = {}
+        self.shortlist_country = None
+
         self.areas = {}
         self.countries = {}
 
-        def timezone_to_title(val):
-            return val.split('/', 1)[1].replace('_', ' ')
-
-        # Parse data
-        for x in load_data('/usr/share/zoneinfo/zone.tab'):
-            xs = x.split('\t')
-
-            country_code, timezone_code = xs[0], xs[2]
-
-            area_title, _, with_subarea = timezone_code.partition('/')
-            subarea_title, _, timezone_title = with_subarea.partition('/')
-
-            area = self.areas.setdefault(area_title, {
-                'title': area_title,
-                'subareas': {}
-            })
-
-            subarea = area['subareas'].setdefault(subarea_title, {
-                'title': subarea_title.replace('_', ' '),
-                'timezones': {},
-            })
-
-            subarea['timezones'].setdefault(timezone_code, {
-                'code': timezone_code,
-                'title': timezone_title.replace('_', ' ') or subarea['title'],
-            })
-
-            self.countries.setdefault(country_code, []).append(timezone_code)
-
-        for x in load_data(find_data('tzmap.override')):
-            country_code, timezone = x.split(' ', 1)
-            self.countries[country_code] = [timezone]
-
         self.treeview = Gtk.TreeView(self.model, headers_visible=False)
         self.treeview.connect('row-activated', self.on_row_activated)
         self.treeview.connect('key-press-event', self.on_key_press_event)
@@ -73,43 +41,40 @@ class Timezone(Page):
         column = Gtk.TreeViewColumn("", renderer, text=1)
         self.treeview.append_column(column)
 
-        scroll = Gtk.ScrolledWindow()
-        scroll.add(self.treeview)
+        search = self.create_search(self.treeview, 2)
 
         vbox = Gtk.VBox()
         vbox.pack_start(label, False, False, LABEL_PADDING)
-        vbox.pack_start(scroll, True, True, 0)
+        vbox.pack_start(self.create_placeholder(search), True, True, 0)
         self.pack_start(vbox, True, True, 0)
 
-    def get_apply_data(self):
-        return {
-            'timezone': self.selected,
-        }
-
-    def on_switch(self):
-        selection = self.treeview.get_selection()
-        selection.handler_block(self.change_handler)
-
-        # Populate model
-        self.model.clear()
-        self.iters = {}
+    def populate(self, data):
+        self.areas = data['areas']
+        self.countries = data['countries']
 
-        country_code = self.assistant.get_all_apply_data()['country']
-        shortlist = self.countries[country_code]
+        self.treeview.set_model(None)
 
-        other_it = self.model.append(None, [None, "Other"])
+        other_key = self.search_index.add(None, "Other")
+        self.other_it = self.model.append(None, [None, "Other", other_key])
 
         # Loop over all areas
         for area in sorted(self.areas.values(), key=cmp_title):
-            area_it = self.model.append(other_it, [None, area['title']])
+            area_key = self.search_index.add(other_key, area['title'])
+            area_it = self.model.append(
+                self.other_it, [None, area['title'], area_key],
+            )
 
             # ... then over each subarea
             for subarea in sorted(area['subareas'].values(), key=cmp_title):
                 # Only show subareas if we have them
                 subarea_it = area_it
+                subarea_key = area_key
                 if len(subarea['timezones']) > 1:
+                    subarea_key = self.search_index.add(
+                        area_key, subarea['title'],
+                    )
                     subarea_it = self.model.append(
-                        area_it, [None, subarea['title']],
+                        area_it, [None, subarea['title'], subarea_key],
                     )
 
                 # ... then over each timezone
@@ -117,18 +82,45 @@ class Timezone(Page):
                 for timezone in sorted(subareas, key=cmp_title):
                     code = timezone['code']
 
-                    # Add to top-level shortlist
-                    if code in shortlist:
-                        self.iters[code] = self.model.insert_before(
-                            None, other_it, [code, timezone['title']]
-                        )
-
+                    key = self.search_index.add(
+                        subarea_key, code, timezone['title'],
+                    )
                     it = self.model.append(
-                        subarea_it, [code, timezone['title']]
+                        subarea_it, [code, timezone['title'], key]
                     )
 
                     # Don't override any previous iter
-                    self.iters.setdefault(code, it)
+                    if code not in self.tree_iters:
+                        self.tree_iters[code] = it
+                        self.titles[code] = timezone['title']
+                        self.order[code] = len(self.order)
+
+        self.set_search_model(self.model)
+
+    def get_apply_data(self):
+        return {
+            'timezone': self.selected,
+        }
+
+    def on_switch(self):
+        self.clear_search()
+
+        selection = self.treeview.get_selection()
+        selection.handler_block(self.change_handler)
+
+        country_code = self.assistant.get_all_apply_data()['country']
+        shortlist = self.countries[country_code]
+
+        # Replace the shortlist rows if the country has changed
+        if country_code != self.shortlist_country:
+            self.shortlist_country = country_code
+
+            # In the same order as the tree
+            codes = [x for x in shortlist if x in self.order]
+            self.replace_shortlist([
+                (x, self.titles[x])
+                for x in sorted(set(codes), key=self.order.get)
+            ])
 
         # Grab focus prior to unblocking change handler
         self.treeview.grab_focus()
@@ -138,6 +130,7 @@ class Timezone(Page):
         # Set a default for this country if we have one
         if not self.selected and shortlist:
             self.selected = shortlist[0]
+            self.changed()
 
         self.treeview.get_selection().unselect_all()
         self.assistant.set_page_complete(self, bool(self.selected))
@@ -145,8 +138,8 @@ class Timezone(Page):
         if not self.selected:
             return
 
-        it = self.iters[self.selected]
-        path = self.model.get_path(it)
+        it = self.get_filter_iter(self.iters[self.selected])
+        path = self.filter.get_path(it)
         self.treeview.expand_to_path(path)
         self.treeview.scroll_to_cell(path, None, True, 0.5, 0)
         self.treeview.get_selection().select_iter(it)
@@ -155,10 +148,12 @@ class Timezone(Page):
         model, treeiter = selection.get_selected()
         if treeiter:
             self.selected = model[treeiter][0]
+            self.changed()
         self.assistant.set_page_complete(self, bool(self.selected))
 
     def on_row_activated(self, treeview, path, column):
-        self.selected = self.model.get_value(self.model.get_iter(path), 0)
+        self.selected = self.filter.get_value(self.filter.get_iter(path), 0)
+        self.changed()
 
         if self.selected:
             self.assistant.notebook.next_page()
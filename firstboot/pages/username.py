@@ -1,9 +1,8 @@
 import re
-import pwd
 
 from gi.repository import Gtk, Gdk
 
-from ..utils import load_data
+from ..validation import USERNAME_MAX_LENGTH, validate_username
 
 from .base import Page, ValidationError, LABEL_PADDING
 
@@ -17,10 +16,7 @@ lower-case letters.
 
 
 class Username(Page):
-    re_valid = re.compile(r'^[a-z][-a-z0-9_]*$')
-    re_starts_with_lowercase = re.compile(r'^[a-z]')
-
-    max_length = 32
+    max_length = USERNAME_MAX_LENGTH
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -40,37 +36,13 @@ class Username(Page):
         vbox.pack_start(self.errors, False, False, LABEL_PADDING)
         self.pack_start(vbox, True, True, 0)
 
-        self.exists = {x[0] for x in pwd.getpwall()}
-        self.reserved = {load_data('/usr/lib/user-setup/reserved-usernames')}
-
     def get_apply_data(self):
         return {
             'username': self.entry.get_text(),
         }
 
     def validate(self, data):
-        val = data['username']
-
-        if not val:
-            raise ValidationError("Username cannot be blank.")
-
-        if len(val) > self.max_length:
-            raise ValidationError("Username is too long.")
-
-        if self.re_starts_with_lowercase.match(val) is None:
-            raise ValidationError(
-                "Username must start with a lower-case letter.",
-            )
-
-        if val in self.exists:
-            raise ValidationError("This username is already in use.")
-
-        if val in self.reserved:
-            raise ValidationError("This username is reserved.")
-
-        # Do a final "sweep" last; we've emitted some nicer messages earlier
-        if self.re_valid.match(val) is None:
-            raise ValidationError("Username contains invalid characters.")
+        validate_username(data)
 
     def on_switch(self):
         # Are we returning to this page?
@@ -96,16 +68,20 @@ class Username(Page):
             pass
 
     def on_entry_changed(self, entry):
-        is_valid = self.render_validation_errors(self.errors)
-
-        self.assistant.set_page_complete(self, is_valid)
+        self.changed()
+        self.schedule_validation(self.errors)
 
     def on_key_press_event(self, widget, event):
         # Ignore spaces
         if event.keyval == Gdk.KEY_space:
             return True
 
-        if event.keyval == Gdk.KEY_Return and self.is_valid():
+        if event.keyval != Gdk.KEY_Return:
+            return False
+
+        self.flush_validation()
+
+        if self.is_valid():
             self.assistant.notebook.next_page()
             return True
 
@@ -0,0 +1,159 @@
+import shlex
+import logging
+
+from . import data
+from .utils import load_data
+from .hooks import HookError
+from .apply_data import ApplyData
+from .validation import ValidationError, validate as validate_fields
+
+# Preseed files contain lines such as "username=alice". Any of these keys may
+# also be passed on the kernel command line as, for example,
+# "firstboot.username=alice", overriding the file, except for "password" as
+# the kernel command line is readable by every user; pass "password_hash"
+# there instead.
+KEYS = (
+    'language',
+    'country',
+    'timezone',
+    'keyboard_layout',
+    'keyboard_variant',
+    'full_name',
+    'username',
+    'password',
+    'password_hash',
+    'hostname',
+)
+
+CMDLINE_PREFIX = 'firstboot.'
+CMDLINE_EXCLUDED_KEYS = frozenset({'password'})
+
+logger = logging.getLogger(__name__)
+
+
+def load(filename, cmdline='/proc/cmdline'):
+    result = {'keyboard_variant': ''}
+
+    for x in load_data(filename):
+        k, _, v = x.partition('=')
+        result[k.strip()] = unquote(v)
+
+    with open(cmdline) as f:
+        for x in split_cmdline(f.read()):
+            if not x.startswith(CMDLINE_PREFIX):
+                continue
+
+            k, _, v = x[len(CMDLINE_PREFIX):].partition('=')
+
+            if k in CMDLINE_EXCLUDED_KEYS:
+                logger.warning(
+                    "Ignoring %s%s on the kernel command line",
+                    CMDLINE_PREFIX, k,
+                )
+                continue
+
+            result[k] = v
+
+    for x in set(result) - set(KEYS):
+        logger.warning("Ignoring unknown preseed key %r", x)
+        del result[x]
+
+    return result
+
+
+def unquote(val):
+    """
+    Strips whitespace and one pair of surrounding quotes from ``val``, eg.
+    ``"Alice Smith"`` becomes ``Alice Smith``. Values may contain spaces and
+    quotes themselves.
+    """
+
+    val = val.strip()
+
+    if len(val) >= 2 and val[0] == val[-1] and val[0] in '"\'':
+        return val[1:-1]
+
+    return val
+
+
+def split_cmdline(cmdline):
+    try:
+        return shlex.split(cmdline)
+    except ValueError as exc:
+        # eg. an unbalanced quote in an unrelated parameter
+        logger.warning("Could not parse kernel command line: %s", exc)
+        return cmdline.split()
+
+
+def validate(val):
+    missing = [
+        x for x in KEYS
+        if x not in val and x not in ('password', 'password_hash')
+    ]
+
+    if missing:
+        raise ValidationError("Missing value(s) for: {}".format(
+            ', '.join(missing),
+        ))
+
+    fields = dict(val)
+
+    if 'password_hash' in val:
+        if not val['password_hash'].startswith('$'):
+            raise ValidationError("Password hash is not a crypt(3) hash.")
+        fields.pop('password', None)
+    else:
+        fields.setdefault('password', '')
+        fields['password_confirm'] = fields['password']
+
+    errors = validate_fields(fields)
+
+    if errors:
+        raise ValidationError(' '.join(errors.values()))
+
+    if val['language'] not in data.get('languages'):
+        raise ValidationError("Unknown language {}".format(val['language']))
+
+    if val['country'] not in data.get('countries')['countries']:
+        raise ValidationError("Unknown country {}".format(val['country']))
+
+    if val['timezone'] not in {
+        y for x in data.get('timezones')['countries'].values() for y in x
+    }:
+        raise ValidationError("Unknown timezone {}".format(val['timezone']))
+
+    layouts = data.get('keyboard')['layouts']
+
+    try:
+        layout = layouts[val['keyboard_layout']]
+    except KeyError:
+        raise ValidationError(
+            "Unknown keyboard layout {}".format(val['keyboard_layout']),
+        )
+
+    if val['keyboard_variant'] and \
+            val['keyboard_variant'] not in layout['variants']:
+        raise ValidationError(
+            "Unknown keyboard variant {}".format(val['keyboard_variant']),
+        )
+
+
+def main(filename, development):
+    logger.info("Loading preseed data from %s", filename)
+
+    val = load(filename)
+
+    try:
+        validate(val)
+    except ValidationError as exc:
+        logger.error("Invalid preseed data: %s", exc)
+        return 1
+
+    try:
+        ApplyData(no_act=development).apply(val)
+    except HookError as exc:
+        # The settings themselves were applied and have not been reverted
+        logger.error("Settings applied but %s", exc)
+        return 1
+
+    return 0
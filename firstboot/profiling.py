@@ -0,0 +1,141 @@
+import os
+import json
+import time
+import logging
+import threading
+import contextlib
+import collections
+
+from .utils import atomic_write
+
+# As early as possible so that phases can be reported relative to startup
+START = time.monotonic()
+
+logger = logging.getLogger(__name__)
+
+
+@contextlib.contextmanager
+def timed(phase):
+    """
+    Logs how long the body of the ``with`` statement took as ``phase``.
+    """
+
+    start = time.monotonic()
+
+    try:
+        yield
+    finally:
+        log_phase(phase, time.monotonic() - start)
+
+
+def mark(phase):
+    """
+    Logs that ``phase`` has been reached.
+    """
+
+    log_phase(phase, 0)
+
+
+def log_phase(phase, duration):
+    since_start = time.monotonic() - START
+
+    # These are sent as structured fields by systemd's JournalHandler so that
+    # they can be queried with, eg. journalctl FIRSTBOOT_PHASE=first-draw
+    logger.info(
+        "Phase %s took %.3fs (%.3fs since startup)",
+        phase,
+        duration,
+        since_start,
+        extra={
+            'FIRSTBOOT_PHASE': phase,
+            'FIRSTBOOT_DURATION_MS': '{:.1f}'.format(duration * 1000),
+            'FIRSTBOOT_SINCE_START_MS': '{:.1f}'.format(since_start * 1000),
+        },
+    )
+
+
+class Spans(object):
+    """
+    Records how long each step took, along with the return code and size of
+    the output of any commands it ran.
+    """
+
+    def __init__(self):
+        self.spans = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    @contextlib.contextmanager
+    def span(self, name):
+        span = collections.OrderedDict((
+            ('name', name),
+            ('start', time.time()),
+            ('duration_ms', None),
+            ('returncode', None),
+            ('output_bytes', 0),
+            ('error', None),
+        ))
+
+        parent = getattr(self.local, 'current', None)
+        self.local.current = span
+
+        start = time.monotonic()
+
+        try:
+            yield span
+        except Exception as exc:
+            span['error'] = str(exc)
+            raise
+        finally:
+            self.local.current = parent
+            span['duration_ms'] = round((time.monotonic() - start) * 1000, 1)
+
+            with self.lock:
+                self.spans.append(span)
+
+            logger.info(
+                "Step %s took %.3fs (return code: %s, output: %d bytes)",
+                name,
+                span['duration_ms'] / 1000,
+                span['returncode'],
+                span['output_bytes'],
+                extra={
+                    'FIRSTBOOT_STEP': name,
+                    'FIRSTBOOT_DURATION_MS': '{:.1f}'.format(
+                        span['duration_ms'],
+                    ),
+                    'FIRSTBOOT_RETURNCODE': str(span['returncode']),
+                    'FIRSTBOOT_OUTPUT_BYTES': str(span['output_bytes']),
+                },
+            )
+
+    def record_command(self, returncode, output_bytes):
+        """
+        Adds the result of a command to the current span of this thread.
+        """
+
+        span = getattr(self.local, 'current', None)
+
+        if span is None:
+            return
+
+        span['output_bytes'] += output_bytes
+
+        # Report the first failure rather than the last command
+        if not span['returncode']:
+            span['returncode'] = returncode
+
+    def write(self, filename):
+        with self.lock:
+            spans = sorted(self.spans, key=lambda x: x['start'])
+
+        try:
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+
+            with atomic_write(filename) as f:
+                json.dump({'spans': spans}, f, indent=2)
+        except OSError as exc:
+            logger.warning("Could not write summary %s: %s", filename, exc)
+            return
+
+        logger.info("Wrote summary to %s", filename)
@@ -0,0 +1,77 @@
+import logging
+import collections
+import concurrent.futures
+
+logger = logging.getLogger(__name__)
+
+MAX_WORKERS = 4
+
+Step = collections.namedtuple('Step', ('name', 'fn', 'requires'))
+
+
+def run_steps(steps, max_workers=MAX_WORKERS):
+    """
+    Runs each step as soon as all of the steps it requires have completed,
+    running independent steps concurrently.
+
+    If a step raises an exception, no further steps are started and the
+    exception is re-raised once the steps that are already running have
+    finished.
+    """
+
+    pending = collections.OrderedDict((x.name, x) for x in steps)
+
+    for x in steps:
+        for y in x.requires:
+            if y not in pending:
+                raise ValueError(
+                    "Step {} requires unknown step {}".format(x.name, y),
+                )
+
+    done = set()
+    running = {}
+    error = None
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        while pending or running:
+            if error is None:
+                for x in list(pending.values()):
+                    if not done.issuperset(x.requires):
+                        continue
+
+                    del pending[x.name]
+                    running[executor.submit(run_step, x)] = x
+
+            if not running:
+                break
+
+            finished, _ = concurrent.futures.wait(
+                running,
+                return_when=concurrent.futures.FIRST_COMPLETED,
+            )
+
+            for future in finished:
+                step = running.pop(future)
+
+                try:
+                    future.result()
+                except Exception as exc:
+                    if error is None:
+                        error = exc
+                    continue
+
+                done.add(step.name)
+
+    if error is not None:
+        raise error
+
+    if pending:
+        raise ValueError("Circular step dependencies: {}".format(
+            ', '.join(pending),
+        ))
+
+
+def run_step(step):
+    logger.info("Starting step %s", step.name)
+
+    step.fn()
@@ -0,0 +1,131 @@
+import bisect
+import unicodedata
+import collections
+
+
+def fold(text):
+    """
+    Returns ``text`` in a form that ignores case and accents, eg. "Zürich" and
+    "zurich" both become "zurich".
+    """
+
+    return ''.join(
+        x for x in unicodedata.normalize('NFKD', text)
+        if not unicodedata.combining(x)
+    ).casefold()
+
+
+class SearchIndex(object):
+    """
+    Case- and accent-insensitive substring search over the rows of a tree.
+
+    Each row is added with the key of its parent row (or ``None``) and the
+    text it should be found by, and is identified by the integer key that
+    ``add`` returns.
+    """
+
+    def __init__(self):
+        self.texts = collections.OrderedDict()
+        self.parents = {}
+        self.children = collections.defaultdict(set)
+        self.next_key = 0
+
+        # Built lazily; all the texts joined together so that we can search
+        # them with a single str.find per match.
+        self.haystack = None
+        self.keys = []
+        self.offsets = []
+
+    def add(self, parent, *texts):
+        key = self.next_key
+        self.next_key += 1
+
+        self.texts[key] = '\n'.join(fold(x) for x in texts if x)
+        self.parents[key] = parent
+        if parent is not None:
+            self.children[parent].add(key)
+
+        self.haystack = None
+
+        return key
+
+    def remove(self, key):
+        for x in list(self.children.pop(key, ())):
+            self.remove(x)
+
+        parent = self.parents.pop(key)
+        if parent is not None:
+            self.children[parent].discard(key)
+
+        del self.texts[key]
+
+        self.haystack = None
+
+    def build(self):
+        self.keys = []
+        self.offsets = []
+
+        offset = 0
+        for k, v in self.texts.items():
+            self.keys.append(k)
+            self.offsets.append(offset)
+            offset += len(v) + 1
+
+        self.haystack = '\n'.join(self.texts.values())
+
+    def find(self, query):
+        """
+        Returns the keys of the rows whose text contains ``query``.
+        """
+
+        query = fold(query.replace('\n', ' '))
+
+        if self.haystack is None:
+            self.build()
+
+        result = set()
+
+        idx = self.haystack.find(query)
+        while idx != -1:
+            i = bisect.bisect_right(self.offsets, idx) - 1
+            result.add(self.keys[i])
+
+            # Continue from the start of the next row
+            if i + 1 == len(self.offsets):
+                break
+            idx = self.haystack.find(query, self.offsets[i + 1])
+
+        return result
+
+    def search(self, query):
+        """
+        Returns the keys of the rows that should be shown when searching for
+        ``query``: those that match along with their ancestors and
+        descendants. Returns ``None`` if every row should be shown.
+        """
+
+        if not query.strip():
+            return None
+
+        matches = self.find(query.strip())
+
+        result = set(matches)
+
+        for x in matches:
+            parent = self.parents[x]
+
+            while parent is not None and parent not in result:
+                result.add(parent)
+                parent = self.parents[parent]
+
+        seen = set(matches)
+        pending = list(matches)
+        while pending:
+            for x in self.children.get(pending.pop(), ()):
+                if x not in seen:
+                    seen.add(x)
+                    pending.append(x)
+
+        result.update(seen)
+
+        return result
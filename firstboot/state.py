@@ -0,0 +1,45 @@
+import collections
+
+
+class State(object):
+    """
+    Aggregates the apply data of all pages.
+
+    Pages call ``changed`` whenever their apply data may have changed; only
+    those pages are queried again the next time the data is requested.
+    """
+
+    def __init__(self):
+        self.pages = collections.OrderedDict()
+        self.values = {}
+        self.dirty = set()
+        self.cache = None
+
+    def add(self, page):
+        self.pages[page.name] = page
+        self.changed(page)
+
+    def changed(self, page):
+        self.dirty.add(page.name)
+        self.cache = None
+
+    def get(self):
+        if self.cache is None:
+            for x in self.dirty:
+                self.values[x] = self.pages[x].get_apply_data()
+            self.dirty.clear()
+
+            self.cache = {}
+            for x in self.pages:
+                self.cache.update(self.values[x])
+
+        return dict(self.cache)
+
+    def snapshot(self):
+        """
+        Returns a copy of the current data of each page, keyed by page name.
+        """
+
+        self.get()
+
+        return {k: dict(v) for k, v in self.values.items()}
@@ -1,12 +1,15 @@
 import os
 import re
+import errno
+import stat
+import time
 import shlex
-import debconf
 import logging
 import importlib
+import threading
+import subprocess
 import contextlib
-
-from systemd.journal import JournalHandler
+import concurrent.futures
 
 
 DATA_DIRS = (
@@ -19,10 +22,19 @@ HOOK_DIRS = (
     '/usr/share/firstboot/hooks',
 )
 
+CACHE_DIR = '/var/cache/firstboot'
+
+# Seconds to wait for another process to release the debconf database
+DEBCONF_TIMEOUT = 120
+
 logger = logging.getLogger(__name__)
 
+_debconf_lock = threading.Lock()
+
 
 def setup_logging(development):
+    from systemd.journal import JournalHandler
+
     handlers = [JournalHandler()]
 
     if development:
@@ -76,12 +88,186 @@ def load_data(filename):
 
 @contextlib.contextmanager
 def get_debconf():
-    debconf.runFrontEnd()
-    db = debconf.Debconf()
+    """
+    Yields a connection to the debconf database via debconf-communicate.
+
+    The database remains locked (and changes are not saved) until the
+    connection is closed, so callers are serialised and should batch their
+    queries.
+    """
+
+    with _debconf_lock:
+        db, p = connect_debconf()
+
+        try:
+            yield db
+        finally:
+            close_debconf(p)
+
+
+def connect_debconf():
+    # Avoid debconf.runFrontEnd() as it re-executes the entire process.
+    import debconf
+
+    deadline = time.monotonic() + DEBCONF_TIMEOUT
+
+    while True:
+        p = subprocess.Popen(
+            ('debconf-communicate', '-fnoninteractive', 'firstboot'),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+        )
+
+        # Debconf issues a VERSION command when constructed, which fails if
+        # debconf-communicate has exited because the database is locked.
+        try:
+            return debconf.Debconf(read=p.stdout, write=p.stdin), p
+        except (OSError, ValueError):
+            close_debconf(p)
+
+        if time.monotonic() > deadline:
+            raise RuntimeError(
+                "Could not connect to debconf; is its database locked?",
+            )
+
+        logger.warning("Could not connect to debconf; retrying")
+        time.sleep(1)
+
+
+def close_debconf(p):
+    # debconf-communicate saves the database and releases its lock on exit
+    with contextlib.suppress(OSError):
+        p.stdin.close()
+
+    p.wait()
+    p.stdout.close()
+
+
+def replace_symlink(target, filename):
+    """
+    Atomically (re)points the symlink ``filename`` at ``target``.
+    """
+
+    tmpname = '{}.firstboot-tmp'.format(filename)
+
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(tmpname)
+
+    os.symlink(target, tmpname)
+    os.rename(tmpname, filename)
+
+
+def replace_file(filename, contents):
+    """
+    Atomically replaces the contents of ``filename``, keeping its permissions
+    and ownership. The caller is responsible for calling ``fsync``.
+    """
+
+    # Replace the target of any symlink, not the symlink itself
+    filename = os.path.realpath(filename)
+
+    try:
+        st = os.stat(filename)
+    except FileNotFoundError:
+        st = None
+
+    with atomic_write(filename) as f:
+        f.write(contents)
+
+        if st is not None:
+            os.fchmod(f.fileno(), stat.S_IMODE(st.st_mode))
+            os.fchown(f.fileno(), st.st_uid, st.st_gid)
+
+
+@contextlib.contextmanager
+def atomic_write(filename, mode='w'):
+    """
+    Opens a temporary file that replaces ``filename`` once the body of the
+    ``with`` statement has completed. If it raises an exception, ``filename``
+    is left untouched.
+    """
+
+    tmpname = '{}.{}.firstboot-tmp'.format(filename, os.getpid())
+
     try:
-        yield db
+        with open(tmpname, mode) as f:
+            yield f
+
+        os.rename(tmpname, filename)
+    except Exception:
+        with contextlib.suppress(OSError):
+            os.unlink(tmpname)
+        raise
+
+
+def fsync(path):
+    """
+    Flushes ``path`` (a file or directory) to disk. Symlinks and missing
+    paths are ignored; their directory should be flushed instead.
+    """
+
+    try:
+        fd = os.open(path, os.O_RDONLY | os.O_NOFOLLOW)
+    except FileNotFoundError:
+        return
+    except OSError as exc:
+        # O_NOFOLLOW on a symlink
+        if exc.errno == errno.ELOOP:
+            return
+        raise
+
+    try:
+        os.fsync(fd)
     finally:
-        db.stop()
+        os.close(fd)
+
+
+def chown_tree(top, uid, gid, max_workers=8):
+    """
+    Recursively changes the ownership of ``top``, skipping any paths that
+    already have the correct owner. Directories are scanned in parallel.
+
+    Returns the number of paths that were changed.
+    """
+
+    def fix(path, st):
+        if st.st_uid == uid and st.st_gid == gid:
+            return 0
+
+        os.chown(path, uid, gid, follow_symlinks=False)
+
+        return 1
+
+    def scan(path):
+        changed = 0
+        subdirs = []
+
+        for entry in os.scandir(path):
+            changed += fix(entry.path, entry.stat(follow_symlinks=False))
+
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+
+        return changed, subdirs
+
+    changed = fix(top, os.lstat(top))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        pending = {executor.submit(scan, top)}
+
+        while pending:
+            finished, pending = concurrent.futures.wait(
+                pending,
+                return_when=concurrent.futures.FIRST_COMPLETED,
+            )
+
+            for future in finished:
+                n, subdirs = future.result()
+                changed += n
+                pending.update(executor.submit(scan, x) for x in subdirs)
+
+    return changed
 
 
 def import_from_string(val):
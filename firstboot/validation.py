@@ -0,0 +1,162 @@
+import os
+import re
+import pwd
+import collections
+
+from .utils import load_data
+
+# Shared by the GUI pages and the preseed frontend, so this module must not
+# import GTK (or anything else expensive).
+
+USERNAME_MAX_LENGTH = 32
+
+HOSTNAME_MIN_LENGTH = 2
+HOSTNAME_MAX_LENGTH = 32
+
+PASSWORD_MIN_LENGTH = 6
+PASSWORD_MAX_LENGTH = 40
+
+re_valid_username = re.compile(r'^[a-z][-a-z0-9_]*$')
+re_starts_with_lowercase = re.compile(r'^[a-z]')
+re_valid_hostname = re.compile(r'^[a-z][-a-z0-9_]*$')
+
+RESERVED_HOSTNAMES = frozenset({'localhost'})
+
+PASSWD = '/etc/passwd'
+RESERVED_USERNAMES = '/usr/lib/user-setup/reserved-usernames'
+
+
+class ValidationError(Exception):
+    pass
+
+
+class UsernameIndex(object):
+    """
+    Existing and reserved usernames, which are only reloaded if /etc/passwd or
+    the list of reserved usernames has been modified.
+    """
+
+    def __init__(self):
+        self.mtimes = None
+        self.existing = frozenset()
+        self.reserved = frozenset()
+
+    def refresh(self):
+        mtimes = tuple(get_mtime(x) for x in (PASSWD, RESERVED_USERNAMES))
+
+        if mtimes == self.mtimes:
+            return
+
+        self.existing = frozenset(x.pw_name for x in pwd.getpwall())
+
+        try:
+            self.reserved = frozenset(load_data(RESERVED_USERNAMES))
+        except FileNotFoundError:
+            self.reserved = frozenset()
+
+        self.mtimes = mtimes
+
+
+usernames = UsernameIndex()
+
+
+def get_mtime(filename):
+    try:
+        return os.stat(filename).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def validate_full_name(data):
+    if not data['full_name']:
+        raise ValidationError("Name cannot be blank.")
+
+
+def validate_username(data):
+    val = data['username']
+
+    if not val:
+        raise ValidationError("Username cannot be blank.")
+
+    if len(val) > USERNAME_MAX_LENGTH:
+        raise ValidationError("Username is too long.")
+
+    if re_starts_with_lowercase.match(val) is None:
+        raise ValidationError(
+            "Username must start with a lower-case letter.",
+        )
+
+    usernames.refresh()
+
+    if val in usernames.existing:
+        raise ValidationError("This username is already in use.")
+
+    if val in usernames.reserved:
+        raise ValidationError("This username is reserved.")
+
+    # Do a final "sweep" last; we've emitted some nicer messages earlier
+    if re_valid_username.match(val) is None:
+        raise ValidationError("Username contains invalid characters.")
+
+
+def validate_password(data):
+    if not data['password']:
+        if data['password_confirm']:
+            raise ValidationError("Please enter a password.")
+        raise ValidationError("Password cannot be blank.")
+
+    if len(data['password']) < PASSWORD_MIN_LENGTH:
+        raise ValidationError(
+            "Password is too short. Please choose a value at least {} "
+            "characters in length".format(PASSWORD_MIN_LENGTH),
+        )
+
+    if len(data['password']) > PASSWORD_MAX_LENGTH:
+        raise ValidationError("Password is too long.")
+
+    if data['password'] != data['password_confirm']:
+        raise ValidationError("Passwords do not match.")
+
+
+def validate_hostname(data):
+    val = data['hostname']
+
+    if not val:
+        raise ValidationError("Hostname cannot be blank.")
+
+    if len(val) > HOSTNAME_MAX_LENGTH:
+        raise ValidationError("Hostname is too long.")
+
+    if val in RESERVED_HOSTNAMES:
+        raise ValidationError("This hostname is reserved.")
+
+    if re_valid_hostname.match(val) is None:
+        raise ValidationError("Hostname contains invalid characters.")
+
+
+VALIDATORS = collections.OrderedDict((
+    ('full_name', validate_full_name),
+    ('username', validate_username),
+    ('password', validate_password),
+    ('hostname', validate_hostname),
+))
+
+
+def validate(data):
+    """
+    Validates every field in ``data`` that we have a validator for, returning
+    a mapping of field names to error messages for those that are invalid.
+    """
+
+    errors = collections.OrderedDict()
+
+    for k, fn in VALIDATORS.items():
+        if k not in data:
+            continue
+
+        try:
+            fn(data)
+        except ValidationError as exc:
+            errors[k] = str(exc)
+
+    return errors